@@ -0,0 +1,262 @@
+"""
+This module reads our USDA tables straight out of the downloaded zip archives.
+
+A table inside an archive is addressed with an `archive.zip::member.csv`
+path, e.g.
+
+    dataset/FoodData_Central_csv_2020-10-30.zip::branded_food.csv
+
+Such paths can be passed wherever a CSV file path is accepted by
+`project01.parser`.  The member is decompressed as it is read, so no
+extracted copy is written to disk.  A member can be named by its path in the
+archive, or by its file name alone when that is unique.
+
+`iter_members()` reads the members of an archive from a stream of bytes,
+such as a download in progress, using the local header in front of each
+member rather than the central directory at the end of the archive.
+"""
+
+import contextlib
+import io
+import os
+import struct
+import zipfile
+import zlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+import pandas as pd
+
+# Separates the archive from the member in a table path.
+MEMBER_SEP = "::"
+
+
+def split_path(path: str) -> Tuple[str, Optional[str]]:
+    """Splits a table path into its file and archive member.
+
+    Args:
+        path (str): A CSV file path, or an `archive.zip::member.csv` path.
+    Returns:
+        tuple: The path of the file on disk, and the member's name or None if
+        the path is not inside an archive.
+    """
+    path = os.fspath(path)
+    if MEMBER_SEP not in path:
+        return path, None
+    archive, member = path.split(MEMBER_SEP, 1)
+    return archive, member
+
+
+def join_path(archive: str, member: str) -> str:
+    """Builds the table path of an archive member.
+
+    Args:
+        archive (str): The path of the zip archive.
+        member (str): The member's name.
+    Returns:
+        str: The `archive.zip::member.csv` path.
+    """
+    return "{}{}{}".format(os.fspath(archive), MEMBER_SEP, member)
+
+
+def find_member(zf: zipfile.ZipFile, member: str) -> str:
+    """Resolves a member name against the contents of an archive.
+
+    Args:
+        zf (zipfile.ZipFile): The open archive.
+        member (str): The member's path, or its file name alone.
+    Returns:
+        str: The member's path in the archive.
+    Raises:
+        KeyError: If no single member matches.
+    """
+    names = zf.namelist()
+    if member in names:
+        return member
+    matches = [name for name in names if name.rsplit("/", 1)[-1] == member]
+    if len(matches) != 1:
+        raise KeyError("{} matches {} members of {}".format(member, len(matches), zf.filename))
+    return matches[0]
+
+
+@contextlib.contextmanager
+def open_table(path: str) -> Iterator:
+    """Opens a table for reading with pandas.
+
+    Args:
+        path (str): A CSV file path, or an `archive.zip::member.csv` path.
+    Yields:
+        The path itself for a plain file, or a binary stream which decompresses
+        the archive member as it is read.
+    """
+    archive, member = split_path(path)
+    if member is None:
+        yield archive
+        return
+    with zipfile.ZipFile(archive, "r") as zf:
+        with zf.open(find_member(zf, member), "r") as fin:
+            yield fin
+
+
+def read_csv(path: str, **kwargs) -> pd.DataFrame:
+    """Reads a table with `pd.read_csv`, from a file or an archive member.
+
+    Args:
+        path (str): A CSV file path, or an `archive.zip::member.csv` path.
+        kwargs: Further arguments for `pd.read_csv`, other than chunksize.
+    Returns:
+        pd.DataFrame: The parsed table.
+    """
+    with open_table(path) as fin:
+        return pd.read_csv(fin, **kwargs)
+
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_LOCAL_SIGNATURE = 0x04034b50
+_DESCRIPTOR_SIGNATURE = 0x08074b50
+_ZIP64_EXTRA = 0x0001
+_HAS_DESCRIPTOR = 0x08
+_BLOCK_SIZE = 1 << 16
+
+
+class _BlockReader:
+    def __init__(self, blocks: Iterable[bytes]) -> None:
+        """Reads exact byte counts from an iterable of byte blocks.
+
+        Args:
+            blocks (Iterable[bytes]): The stream's blocks, in order.
+        """
+        self._blocks = iter(blocks)
+        self._pending = b""
+
+    def read_some(self, size: int) -> bytes:
+        """Reads up to `size` bytes, or b"" at the end of the stream."""
+        if not self._pending:
+            self._pending = next(self._blocks, b"")
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def read(self, size: int) -> bytes:
+        """Reads exactly `size` bytes, or fewer at the end of the stream."""
+        parts = []
+        while size > 0:
+            data = self.read_some(size)
+            if not data:
+                break
+            parts.append(data)
+            size -= len(data)
+        return b"".join(parts)
+
+    def unread(self, data: bytes) -> None:
+        """Returns bytes to the front of the stream."""
+        self._pending = data + self._pending
+
+    def drain(self) -> None:
+        """Consumes the rest of the stream."""
+        self._pending = b""
+        for _ in self._blocks:
+            pass
+
+
+class _MemberReader(io.RawIOBase):
+    def __init__(self, reader: _BlockReader, method: int, size: Optional[int]) -> None:
+        """Decompresses one member of a zip stream as it is read.
+
+        Args:
+            reader (_BlockReader): The archive stream, positioned at the member's data.
+            method (int): The member's compression method.
+            size (int): The member's compressed size, or None if it is only
+                known from the end of the compressed data.
+        """
+        super().__init__()
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise NotImplementedError("Unsupported zip compression method {}".format(method))
+        if method == zipfile.ZIP_STORED and size is None:
+            raise NotImplementedError("Stored zip members need their size in the local header")
+        self._reader = reader
+        self._inflate = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        self._remaining = size
+        self._output = b""
+        self._done = False
+        self.crc = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self) -> None:
+        while not self._output and not self._done:
+            want = _BLOCK_SIZE if self._remaining is None else min(_BLOCK_SIZE, self._remaining)
+            data = self._reader.read_some(want) if want else b""
+            if self._remaining is not None:
+                self._remaining -= len(data)
+            if self._inflate is None:
+                self._output = data
+                self._done = not data or self._remaining == 0
+            else:
+                self._output = self._inflate.decompress(data)
+                if self._inflate.eof:
+                    self._reader.unread(self._inflate.unused_data)
+                    self._done = True
+                elif not data:
+                    raise EOFError("Zip stream ended inside a member")
+            self.crc = zlib.crc32(self._output, self.crc)
+
+    def readinto(self, buffer) -> int:
+        self._fill()
+        size = min(len(buffer), len(self._output))
+        buffer[:size] = self._output[:size]
+        self._output = self._output[size:]
+        return size
+
+    def finish(self) -> None:
+        """Reads the rest of the member, leaving the stream after its data."""
+        while self.readinto(bytearray(_BLOCK_SIZE)):
+            pass
+
+
+def iter_members(blocks: Iterable[bytes]) -> Iterator[Tuple[str, io.BufferedReader]]:
+    """Reads the members of a zip archive from a stream of bytes.
+
+    Each member is decompressed while it is read, and must be read (or left
+    alone) before moving on to the next member; any unread data is skipped.
+    The stream is consumed to its end, and the CRC of every member is checked.
+
+    Args:
+        blocks (Iterable[bytes]): The archive's bytes, in order, e.g. the blocks
+            of an HTTP response.
+    Yields:
+        tuple: The member's name, and a binary stream of its decompressed contents.
+    Raises:
+        zipfile.BadZipFile: If a member does not match its CRC.
+    """
+    reader = _BlockReader(blocks)
+    while True:
+        header = reader.read(_LOCAL_HEADER.size)
+        if len(header) < _LOCAL_HEADER.size or _LOCAL_HEADER.unpack(header)[0] != _LOCAL_SIGNATURE:
+            # The central directory follows the last member.
+            reader.drain()
+            return
+        _, _, flags, method, _, _, crc, csize, _, name_len, extra_len = _LOCAL_HEADER.unpack(header)
+        name = reader.read(name_len).decode("utf-8" if flags & 0x800 else "cp437")
+        extra = reader.read(extra_len)
+        zip64 = False
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, length = struct.unpack_from("<HH", extra, pos)
+            if tag == _ZIP64_EXTRA:
+                zip64 = True
+                if csize == 0xFFFFFFFF and length >= 16:
+                    csize = struct.unpack_from("<Q", extra, pos + 12)[0]
+            pos += 4 + length
+        described = bool(flags & _HAS_DESCRIPTOR)
+        member = _MemberReader(reader, method, None if described else csize)
+        if not name.endswith("/"):
+            yield name, io.BufferedReader(member, _BLOCK_SIZE)
+        member.finish()
+        if described:
+            signature = reader.read(4)
+            if struct.unpack("<I", signature)[0] != _DESCRIPTOR_SIGNATURE:
+                reader.unread(signature)
+            crc = struct.unpack("<I", reader.read(4))[0]
+            reader.read(16 if zip64 else 8)
+        if member.crc != crc:
+            raise zipfile.BadZipFile("Bad CRC-32 for {}".format(name))
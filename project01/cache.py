@@ -0,0 +1,299 @@
+"""
+This module provides a columnar, on-disk cache for our parsed USDA tables.
+
+Parsing a multi-hundred-megabyte CSV file dominates the start-up time of
+every question driver.  The first time a table is loaded, each of its
+columns is written to a cache directory next to the CSV file as a raw
+array; later loads memory-map those arrays instead of re-parsing the CSV.
+Text columns are the exception: they are stored memory-mapped, but are
+decoded into Python strings on every load.
+
+Each cache is keyed by the size, modification time and content hash of
+the source file, as well as the schema used to type its columns.  The
+size and modification time are checked on every load; the content hash
+is only recomputed when the modification time has changed, which lets a
+copied or touched file keep its cache without paying for a hash on every
+warm start.
+"""
+
+import codecs
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from project01.archive import split_path
+
+# Name of the directory, next to the source file, holding the caches.
+CACHE_DIR = ".cache"
+# Bumped whenever the on-disk layout changes.
+CACHE_VERSION = 1
+
+_META_FILE = "meta.json"
+_HASH_BLOCK = 1 << 20
+
+
+def content_hash(path: str) -> str:
+    """Computes the content hash used to key a cache.
+
+    Args:
+        path (str): The path of the file to hash.
+    Returns:
+        str: The hex digest of the file's contents.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_text(values: Iterable) -> Dict[str, np.ndarray]:
+    """Packs a sequence of optional strings into a flat layout.
+
+    Args:
+        values (Iterable): The strings to pack, where missing values are NaN.
+    Returns:
+        dict: The utf-8 `blob`, the per-value character `offsets` and a
+            `nulls` mask.
+    """
+    strs = [x if isinstance(x, str) else None for x in values]
+    nulls = np.fromiter((x is None for x in strs), dtype=bool, count=len(strs))
+    strs = [x if x is not None else "" for x in strs]
+    offsets = np.zeros(len(strs) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, strs), dtype=np.int64, count=len(strs)), out=offsets[1:])
+    blob = np.frombuffer("".join(strs).encode("utf-8"), dtype=np.uint8)
+    return {"blob": blob, "offsets": offsets, "nulls": nulls}
+
+
+def decode_text(blob: np.ndarray, offsets: np.ndarray, nulls: np.ndarray) -> np.ndarray:
+    """Unpacks the layout produced by `encode_text`.
+
+    The blob is decoded straight from its buffer, so a memory-mapped blob is
+    not copied first.  The result is not memory-mapped, though: pandas needs a
+    Python string per value, and the offsets count characters rather than
+    bytes, so every value is decoded and held in memory.
+
+    Returns:
+        np.ndarray: An object array of strings, with NaN for missing values.
+    """
+    text = codecs.decode(memoryview(blob), "utf-8")
+    bounds = offsets.tolist()
+    values = np.array([text[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)], dtype=object)
+    values[nulls] = np.nan
+    return values
+
+
+def _is_text(series: pd.Series) -> bool:
+    return pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty")
+
+
+class ColumnCache:
+    def __init__(self, csv_file: str, table: str, schema: Dict[str, str]) -> None:
+        """A columnar cache of a single CSV file.
+
+        Args:
+            csv_file (str): The path to the CSV file being cached.  For an
+                `archive.zip::member.csv` path, the archive is the source file.
+            table (str): The name of the table the file is loaded as.  Caches of
+                the same file loaded as different tables are kept apart.
+            schema (dict): The column types the table is loaded with.
+        """
+        self._source, member = split_path(csv_file)
+        self._schema = dict(schema)
+        base_dir, name = os.path.split(os.path.abspath(self._source))
+        if member is not None:
+            name = "{}.{}".format(name, member.replace("/", "."))
+        self._dir = os.path.join(base_dir, CACHE_DIR, "{}.{}".format(name, table))
+        self._meta = None
+
+    @property
+    def path(self) -> str:
+        """Provides the directory the cache is stored in.
+        """
+        return self._dir
+
+    def _read_meta(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._dir, _META_FILE), "r") as fin:
+                return json.load(fin)
+        except (OSError, ValueError):
+            return None
+
+    def _source_stat(self) -> dict:
+        stat = os.stat(self._source)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def is_valid(self) -> bool:
+        """Checks whether the cache still matches its source file.
+
+        Returns:
+            bool: True if the cache can be read in place of the source file.
+        """
+        meta = self._read_meta()
+        if meta is None or meta.get("version") != CACHE_VERSION or meta.get("schema") != self._schema:
+            return False
+        stat = self._source_stat()
+        if stat["size"] != meta["source"]["size"]:
+            return False
+        if stat["mtime_ns"] != meta["source"]["mtime_ns"]:
+            # The file was touched or copied; only its contents matter.
+            if content_hash(self._source) != meta["source"]["hash"]:
+                return False
+            meta["source"].update(stat)
+            self._write_meta(self._dir, meta)
+        self._meta = meta
+        return True
+
+    @property
+    def columns(self) -> List[str]:
+        """Provides the names of the columns held in the cache.
+        """
+        meta = self._meta if self._meta is not None else self._read_meta()
+        return [col["name"] for col in meta["columns"]] if meta else []
+
+    def artifact(self, name: str) -> Optional[str]:
+        """Provides a path in the cache for data derived from the cached table.
+
+        Derived data stored at this path is discarded along with the cache when
+        the source file changes.
+
+        Args:
+            name (str): The file name of the derived data.
+        Returns:
+            str: The path to store the data at, or None if the cache is not valid.
+        """
+        return os.path.join(self._dir, name) if self._meta is not None else None
+
+    @staticmethod
+    def _write_meta(directory: str, meta: dict) -> None:
+        staging = os.path.join(directory, _META_FILE + ".tmp")
+        with open(staging, "w") as fout:
+            json.dump(meta, fout)
+        os.replace(staging, os.path.join(directory, _META_FILE))
+
+    def _read_column(self, entry: dict) -> pd.Series:
+        path = os.path.join(self._dir, entry["file"])
+        kind = entry["kind"]
+        if kind == "numeric":
+            values = np.load(path + ".npy", mmap_mode="c")
+        elif kind == "datetime":
+            values = np.load(path + ".npy", mmap_mode="c").view("datetime64[ns]")
+        elif kind == "category":
+            codes = np.load(path + ".npy", mmap_mode="c")
+            categories = decode_text(*(np.load("{}.{}.npy".format(path, part))
+                                        for part in ("blob", "offsets", "nulls")))
+            values = pd.Categorical.from_codes(codes, categories=categories)
+        elif kind == "text":
+            values = decode_text(*(np.load("{}.{}.npy".format(path, part), mmap_mode="r")
+                                    for part in ("blob", "offsets", "nulls")))
+        else:
+            return pd.read_pickle(path + ".pkl")
+        return pd.Series(values, name=entry["name"])
+
+    def read(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Loads the cached columns into a dataframe.
+
+        Args:
+            columns (list(str)): The columns to load.  Defaults to every column.
+        Returns:
+            pd.DataFrame: The cached table.
+        """
+        meta = self._meta if self._meta is not None else self._read_meta()
+        entries = meta["columns"]
+        if columns is not None:
+            wanted = set(columns)
+            entries = [entry for entry in entries if entry["name"] in wanted]
+        return pd.DataFrame({entry["name"]: self._read_column(entry) for entry in entries},
+                            columns=[entry["name"] for entry in entries])
+
+    @staticmethod
+    def _write_column(path: str, series: pd.Series) -> str:
+        if pd.api.types.is_categorical_dtype(series):
+            np.save(path + ".npy", series.cat.codes.to_numpy())
+            for part, values in encode_text(series.cat.categories).items():
+                np.save("{}.{}.npy".format(path, part), values)
+            return "category"
+        if pd.api.types.is_datetime64_dtype(series):
+            np.save(path + ".npy", series.to_numpy().view(np.int64))
+            return "datetime"
+        if series.dtype != object:
+            np.save(path + ".npy", series.to_numpy())
+            return "numeric"
+        if _is_text(series):
+            for part, values in encode_text(series).items():
+                np.save("{}.{}.npy".format(path, part), values)
+            return "text"
+        series.to_pickle(path + ".pkl")
+        return "pickle"
+
+    def write(self, df: pd.DataFrame) -> bool:
+        """Replaces the cache with the columns of the passed dataframe.
+
+        The cache is built in a temporary directory and moved into place, so
+        an interrupted write never leaves a partial cache behind.  Failing to
+        write the cache (e.g. on a read-only dataset) is not an error.
+
+        Args:
+            df (pd.DataFrame): The freshly parsed table.
+        Returns:
+            bool: True if the cache was written.
+        """
+        parent = os.path.dirname(self._dir)
+        try:
+            os.makedirs(parent, exist_ok=True)
+            stat = self._source_stat()
+            staging = tempfile.mkdtemp(dir=parent)
+        except OSError:
+            return False
+        try:
+            entries = []
+            for pos, col in enumerate(df.columns):
+                entry = {"name": col, "file": "c{:04d}".format(pos)}
+                entry["kind"] = self._write_column(os.path.join(staging, entry["file"]), df[col])
+                entries.append(entry)
+            meta = {"version": CACHE_VERSION,
+                    "schema": self._schema,
+                    "source": dict(stat, hash=content_hash(self._source)),
+                    "columns": entries}
+            self._write_meta(staging, meta)
+            shutil.rmtree(self._dir, ignore_errors=True)
+            os.replace(staging, self._dir)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        self._meta = meta
+        return True
+
+    def add(self, df: pd.DataFrame) -> bool:
+        """Adds the columns of the passed dataframe to a valid cache.
+
+        This lets a cache that was built from a projection of the table grow
+        as further columns are loaded.  Columns already cached are skipped.
+
+        Args:
+            df (pd.DataFrame): Freshly parsed columns of the table.
+        Returns:
+            bool: True if the columns were added.
+        """
+        if self._meta is None:
+            return False
+        meta = dict(self._meta, columns=list(self._meta["columns"]))
+        known = set(self.columns)
+        try:
+            for col in df.columns:
+                if col in known:
+                    continue
+                entry = {"name": col, "file": "c{:04d}".format(len(meta["columns"]))}
+                entry["kind"] = self._write_column(os.path.join(self._dir, entry["file"]), df[col])
+                meta["columns"].append(entry)
+            self._write_meta(self._dir, meta)
+        except OSError:
+            return False
+        self._meta = meta
+        return True
@@ -13,20 +13,59 @@ Example:
     $ python -m project01.fetch path/to/uri.txt output/dir
 
     The URIs listed in the file path/to/uri.txt will be Files will be saved to output/dir.
+    Up to four URIs are downloaded at once; use -j to change the limit.
 
     If no arguments are specified, they defaults (./uri.txt, and ./dataset)
+
+    A line of the URI file may list the archive's sha256 checksum after its URL,
+    e.g. "https://.../FoodData_Central_csv_2020-10-30.zip sha256:3fa9...".  The
+    download is then verified against it.
+
+Only the archive members matching a list of glob patterns can be extracted, such
+as PIPELINE_MEMBERS, the tables read by our pipelines; the command line does so by
+default.  Members are decompressed in parallel.
+
+Downloads are kept in a .downloads directory of the output directory until they
+complete, so an interrupted download is resumed by the next fetch rather than
+restarted.  Completed archives are kept in the output directory, next to their
+extracted directory, so their tables can also be read straight from the archive
+(see `project01.archive`); with --no-extract, only the archive is kept.
+Archives which were already fetched are only downloaded again when the server
+reports that they changed; a changed allow-list, or extracting an archive
+fetched with --no-extract, reads the kept archive once its checksum is verified.
 """
 
+import fnmatch
+import hashlib
+import json
 import os
-import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterable, List, Optional
 
 import requests
-import tempfile
 import zipfile
 
+# The number of bytes read from a response at a time.
+_BLOCK_SIZE = 1 << 16
+# Name of the directory, in the output directory, holding partial downloads.
+DOWNLOAD_DIR = ".downloads"
+# The archive members read by our pipelines.  Patterns are also matched
+# against each member's file name, so exact names leave out look-alikes such
+# as foundation_food.csv.
+PIPELINE_MEMBERS = ("branded_food.csv", "food.csv", "nutrient.csv", "food_nutrient.csv")
+
 
 class Fetcher:
-    def __init__(self, uris: str = "uri.txt", base: str = "dataset", feedback: bool = True):
+    def __init__(self,
+                 uris: str = "uri.txt",
+                 base: str = "dataset",
+                 feedback: bool = True,
+                 workers: int = 4,
+                 retries: int = 3,
+                 members: Optional[Iterable[str]] = None,
+                 extract_workers: Optional[int] = None,
+                 extract: bool = True):
         """Creates a new fetcher method configured with the arguments specified.
 
         Args:
@@ -35,10 +74,29 @@ class Fetcher:
            base (str): A path to a directory to write the resulting files to.
            feedback (bool): Specifies if user feedback during the download process
                should occur.  When true, text is written to stdout.
+           workers (int): The maximum number of URIs to download at once.
+           retries (int): The number of times an interrupted download is resumed
+               before giving up.
+           members (Iterable[str]): Glob patterns of the archive members to extract,
+               matched against each member's path and file name, e.g. PIPELINE_MEMBERS.
+               Defaults to extracting every member.
+           extract_workers (int): The maximum number of members of an archive to
+               decompress at once.  Defaults to the number of CPUs.
+           extract (bool): Whether to extract the archives.  They are kept in the
+               output directory either way.
         """
-        self._uris = self.__parse_file(uris)
+        self._uris = list()
+        self._checksums = dict()
+        for line in self.__parse_file(uris):
+            if line.strip():
+                self.add_uri(*line.split(None, 1))
         self._base = base
         self._feedback = feedback
+        self._workers = workers
+        self._retries = retries
+        self._members = list(members) if members is not None else None
+        self._extract_workers = extract_workers or os.cpu_count() or 1
+        self._extract = extract
 
     @staticmethod
     def __parse_file(uri_file):
@@ -56,62 +114,356 @@ class Fetcher:
                     ret.append(uri.rstrip())
         return ret
 
-    def add_uri(self, uri: str):
+    def add_uri(self, uri: str, checksum: str = None):
         """Adds a URI to the list of download links after creation of the object.
 
         Args:
             uri (str): A fully qualified string to fetch to artifact from
+            checksum (str): The expected sha256 hex digest of the artifact, optionally
+                prefixed with "sha256:".  Defaults to not verifying the download.
         Returns:
             list(str): A listing of all URIs the instance is currently configured
                 to support.
         """
         self._uris.append(uri)
+        if checksum:
+            self._checksums[uri] = checksum.strip().lower().split("sha256:")[-1]
         return self._uris
 
-    def fetch(self, feedback: bool = None, out: str = None) -> str:
+    def fetch(self, feedback: bool = None, out: str = None, workers: int = None) -> str:
         """Downloads all URIs the the current object and extracts them to the class's directory.
 
+        Up to `workers` URIs are downloaded at once, and each archive is
+        extracted as soon as its own download finishes, while the other
+        downloads carry on.
+
         Args:
             feedback(bool): Overide the classes feedback state.  If True, the download
                 progress will be echoed to screen.
             out(str): Overrides the classes output director.  If specified, the downloaded
                 files will be written to the directory that has been specified.
+            workers(int): Overrides the classes limit on concurrent downloads.
         Returns:
             str: The output path of the extracted files.
         """
         feedback = feedback if feedback is not None else self._feedback
         out = out if out is not None else self._base
-        with tempfile.TemporaryDirectory() as temp_dir:
-            for uri in self._uris:
-                filename = os.path.basename(uri)
-                # Use stream to download very large files
-                resp = requests.get(uri, stream=True)
-                resp.raise_for_status()
-                uri_size = resp.headers.get('content-length')  # Get the size of the download
-                if feedback:
-                    print("Downloading {}".format(uri))
-                with open(os.path.join(temp_dir, filename), "wb") as zipf:
-                    tracker = 0
-                    for block in resp.iter_content(4096):
-                        tracker += len(block)
-                        zipf.write(block)
-                        if feedback:
-                            done = int(50 * tracker / int(uri_size))  # Total Progress
-                            # We need an unbuffered printer here...
-                            sys.stdout.write("\r[%s%s] %s/100" % ('=' * done, ' ' * (50-done), done*2))
-                            sys.stdout.flush()
-                    print("")
-            for root, dirs, files in os.walk(temp_dir):
-                for zipf in files:
-                    temp_zip = os.path.join(root, zipf)
-                    with zipfile.ZipFile(temp_zip, "r") as zf:
-                        if feedback:
-                            print("Extracting {}".format(zipf))
-                        stripped_name, ext = os.path.splitext(temp_zip)
-                        basen = os.path.basename(stripped_name)
-                        zf.extractall(os.path.join(out, basen))
+        workers = workers if workers is not None else self._workers
+        progress = _Progress(feedback)
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            jobs = [pool.submit(self._fetch_one, uri, out, progress) for uri in self._uris]
+            # Surface the first failure, once every other job has finished.
+            wait(jobs)
+            for job in jobs:
+                job.result()
         return out
 
+    def _fetch_one(self, uri: str, out: str, progress: "_Progress") -> str:
+        """Downloads a single URI, unless it is unchanged, and extracts it.
+
+        Interrupted downloads are resumed up to the object's number of retries.
+        The archive is kept in the output directory.
+
+        Args:
+            uri (str): The URI of the archive.
+            out (str): The directory to save and extract the archive to.
+            progress (_Progress): The tracker to report progress to.
+        Returns:
+            str: The directory the archive was extracted to, or the archive's
+            path if it is not extracted.
+        """
+        filename = os.path.basename(uri)
+        basen, _ = os.path.splitext(filename)
+        target = os.path.join(out, basen)
+        kept = os.path.join(out, filename)
+        downloads = os.path.join(out, DOWNLOAD_DIR)
+        os.makedirs(downloads, exist_ok=True)
+        archive = os.path.join(downloads, filename)
+        result = target if self._extract else kept
+        previous = _read_meta(archive)
+        extracted = (os.path.isdir(target) and previous.get("extracted", True)
+                     and previous.get("members") == self._members)
+        if self._extract and not extracted and _is_kept(kept, previous, self._checksums.get(uri)):
+            # Only the allow-list, or the choice to extract, changed: the kept
+            # archive is extracted again rather than downloaded again.
+            progress.message("Extracting {}".format(filename))
+            extract(kept, target, self._members, self._extract_workers)
+            _write_meta(archive, dict(previous, extracted=True, members=self._members))
+            progress.message("Extracted {}".format(filename))
+            return result
+        fetched = os.path.exists(kept) and (extracted or not self._extract)
+        for attempt in range(self._retries + 1):
+            try:
+                meta = _download(uri, archive, fetched, self._checksums.get(uri), progress)
+                break
+            except requests.HTTPError:
+                raise
+            except IOError:
+                if attempt == self._retries:
+                    raise
+                progress.message("Resuming {}".format(filename))
+        if meta is None:
+            progress.message("Up to date {}".format(filename))
+            return result
+        if self._extract:
+            progress.message("Extracting {}".format(filename))
+            extract(archive, target, self._members, self._extract_workers)
+        os.replace(archive, kept)
+        _write_meta(archive, dict(meta, complete=True, extracted=self._extract, members=self._members))
+        progress.message("{} {}".format("Extracted" if self._extract else "Saved", filename))
+        return result
+
+
+def selected(name: str, members: Optional[Iterable[str]]) -> bool:
+    """Checks whether an archive member matches an allow-list of glob patterns.
+
+    Args:
+        name (str): The member's path within the archive.
+        members (Iterable[str]): The glob patterns, or None to allow every member.
+    Returns:
+        bool: True if the member should be extracted.
+    """
+    if members is None:
+        return True
+    base = name.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(base, pattern) for pattern in members)
+
+
+def extract(archive: str, target: str, members: Optional[Iterable[str]] = None, workers: int = 1) -> List[str]:
+    """Extracts the members of an archive which match an allow-list.
+
+    Members are independent, so up to `workers` of them are decompressed at
+    once, each through its own handle on the archive.
+
+    Args:
+        archive (str): The path of the zip archive.
+        target (str): The directory to extract to.
+        members (Iterable[str]): Glob patterns of the members to extract.
+            Defaults to every member.
+        workers (int): The maximum number of members to decompress at once.
+    Returns:
+        list(str): The names of the extracted members.
+    """
+    with zipfile.ZipFile(archive, "r") as zf:
+        names = [info.filename for info in zf.infolist() if not info.is_dir() and selected(info.filename, members)]
+    # Create the members' directories up front, so concurrent extractions
+    # do not race to create them.
+    for parent in {os.path.dirname(name) for name in names}:
+        if parent and not os.path.isabs(parent) and not os.path.normpath(parent).startswith(".."):
+            os.makedirs(os.path.join(target, parent), exist_ok=True)
+    os.makedirs(target, exist_ok=True)
+    if workers <= 1 or len(names) <= 1:
+        _extract_members(archive, target, names)
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+            jobs = [pool.submit(_extract_members, archive, target, [name]) for name in names]
+            wait(jobs)
+            for job in jobs:
+                job.result()
+    return names
+
+
+def _extract_members(archive: str, target: str, names: List[str]) -> None:
+    with zipfile.ZipFile(archive, "r") as zf:
+        for name in names:
+            zf.extract(name, target)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_kept(kept: str, meta: dict, checksum: Optional[str]) -> bool:
+    """Checks whether the archive kept by a previous fetch is complete and intact.
+
+    Args:
+        kept (str): The path of the kept archive.
+        meta (dict): The archive's recorded metadata.
+        checksum (str): The expected sha256 hex digest of the archive, if any.
+    Returns:
+        bool: True if the archive matches its recorded size and checksum.
+    """
+    if not meta.get("complete") or not meta.get("sha256") or not os.path.exists(kept):
+        return False
+    if os.path.getsize(kept) != meta.get("size") or (checksum is not None and checksum != meta["sha256"]):
+        return False
+    return _sha256(kept) == meta["sha256"]
+
+
+def _read_meta(archive: str) -> dict:
+    try:
+        with open(archive + ".json", "r") as fin:
+            return json.load(fin)
+    except (OSError, ValueError):
+        return dict()
+
+
+def _write_meta(archive: str, meta: dict) -> None:
+    staging = archive + ".json.tmp"
+    with open(staging, "w") as fout:
+        json.dump(meta, fout)
+    os.replace(staging, archive + ".json")
+
+
+def _download(uri: str,
+              archive: str,
+              fetched: bool,
+              checksum: Optional[str],
+              progress: "_Progress") -> Optional[dict]:
+    """Downloads an archive, resuming a partial download and skipping an unchanged one.
+
+    The download is written to `archive`.part, which is kept if the download is
+    interrupted.  The archive's ETag and Last-Modified validators are recorded
+    in `archive`.json; they make the next request resume the partial file with
+    a Range request, or skip an unchanged archive with a conditional request.
+    A part which already holds the whole archive, which the server answers
+    with 416 Range Not Satisfiable, is verified and kept; any other part the
+    server rejects is discarded and the archive downloaded from the start.
+
+    Args:
+        uri (str): The URI of the archive.
+        archive (str): The path to download the archive to.
+        fetched (bool): Whether a previous download of the archive is still in place.
+        checksum (str): The expected sha256 hex digest of the archive, if any.
+        progress (_Progress): The tracker to report progress to.
+    Returns:
+        dict: The archive's validators and checksum, or None if the archive is
+        unchanged since it was last extracted.
+    Raises:
+        IOError: If the download was interrupted.
+        ValueError: If the download does not match its checksum.
+    """
+    filename = os.path.basename(archive)
+    part = archive + ".part"
+    meta = _read_meta(archive)
+    validator = meta.get("etag") or meta.get("last_modified")
+    # Byte ranges and lengths refer to the archive as stored, not a compressed transfer.
+    headers = {"Accept-Encoding": "identity"}
+    offset = 0
+    if meta.get("complete") and fetched:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+    elif validator and meta.get("uri") == uri and os.path.exists(part):
+        offset = os.path.getsize(part)
+        headers["Range"] = "bytes={}-".format(offset)
+        headers["If-Range"] = validator
+    with requests.get(uri, stream=True, headers=headers) as resp:
+        if resp.status_code == 304:
+            return None
+        if resp.status_code == 416 and offset:
+            # The part reaches the end of the archive, e.g. a previous fetch
+            # stopped after writing all of it but before keeping it.
+            sha256 = _sha256(part)
+            if _range_size(resp.headers.get("Content-Range")) == offset or sha256 == checksum:
+                return _keep_part(uri, archive, meta, checksum, sha256, offset)
+            # Otherwise the part does not match the archive; start over.
+            os.remove(part)
+            progress.message("Restarting {}".format(filename))
+            return _download(uri, archive, fetched, checksum, progress)
+        resp.raise_for_status()
+        if resp.status_code != 206:
+            # A full response: the archive changed, or the server ignored the range.
+            offset = 0
+        meta = {"uri": uri,
+                "etag": resp.headers.get("ETag"),
+                "last_modified": resp.headers.get("Last-Modified"),
+                "complete": False}
+        _write_meta(archive, meta)
+        # Keep the bytes received before a dropped connection; the length is
+        # checked once the body ends.
+        resp.raw.enforce_content_length = False
+        length = resp.headers.get("content-length")
+        total = offset + int(length) if length is not None else None
+        digest = hashlib.sha256()
+        if offset:
+            with open(part, "rb") as fin:
+                for block in iter(lambda: fin.read(_BLOCK_SIZE), b""):
+                    digest.update(block)
+        progress.start(filename, total)
+        progress.advance(filename, offset)
+        written = offset
+        with open(part, "ab" if offset else "wb") as fout:
+            for block in resp.iter_content(_BLOCK_SIZE):
+                fout.write(block)
+                digest.update(block)
+                written += len(block)
+                progress.advance(filename, len(block))
+    if total is not None and written != total:
+        raise IOError("Download of {} ended after {} of {} bytes".format(uri, written, total))
+    return _keep_part(uri, archive, meta, checksum, digest.hexdigest(), written)
+
+
+def _range_size(content_range: Optional[str]) -> Optional[int]:
+    """Reads the complete length from a Content-Range header, e.g. "bytes */1234"."""
+    try:
+        return int(content_range.rsplit("/", 1)[1])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _keep_part(uri: str, archive: str, meta: dict, checksum: Optional[str], sha256: str, size: int) -> dict:
+    """Verifies a complete download and moves it from `archive`.part to `archive`.
+
+    Returns:
+        dict: The archive's validators, checksum and size.
+    Raises:
+        ValueError: If the download does not match its checksum.
+    """
+    if checksum is not None and sha256 != checksum:
+        os.remove(archive + ".part")
+        os.remove(archive + ".json")
+        raise ValueError("Checksum mismatch for {}: expected {}, got {}".format(uri, checksum, sha256))
+    os.replace(archive + ".part", archive)
+    return dict(meta, sha256=sha256, size=size)
+
+
+class _Progress:
+    def __init__(self, feedback: bool = True, step: int = 10) -> None:
+        """Reports the progress of several concurrent downloads.
+
+        Each download reports on its own line, every `step` percent, so the
+        output of concurrent downloads does not interleave within a line.
+
+        Args:
+            feedback (bool): Whether to write any output.
+            step (int): The percentage between two reports of a download.
+        """
+        self._feedback = feedback
+        self._step = step
+        self._lock = threading.Lock()
+        self._state = dict()
+
+    def message(self, text: str) -> None:
+        """Writes a line of output."""
+        if self._feedback:
+            with self._lock:
+                print(text, flush=True)
+
+    def start(self, name: str, total: Optional[int]) -> None:
+        """Registers a download of `total` bytes, if known."""
+        with self._lock:
+            self._state[name] = [0, total, 0]
+        self.message("Downloading {}".format(name))
+
+    def advance(self, name: str, size: int) -> None:
+        """Records `size` more bytes of a download."""
+        with self._lock:
+            state = self._state[name]
+            state[0] += size
+            if not state[1]:
+                return
+            done = min(100, 100 * state[0] // state[1]) // self._step * self._step
+            if done <= state[2]:
+                return
+            state[2] = done
+        self.message("{}: {}/100".format(name, done))
+
 
 def cli():
     """Creates a CLI parser
@@ -129,14 +481,23 @@ def cli():
     parser.add_argument("outdir", nargs="?",
                         default="dataset",
                         help="Path to a directory to output the files.")
+    parser.add_argument("-j", "--workers", type=int,
+                        default=4,
+                        help="Maximum number of URIs to download at once.")
+    parser.add_argument("-m", "--members", nargs="+",
+                        default=list(PIPELINE_MEMBERS),
+                        help="Glob patterns of the archive members to extract.  Use '*' for every member.")
+    parser.add_argument("--no-extract", dest="extract", action="store_false",
+                        help="Only keep the archives, whose tables are read without extracting them.")
     return parser
 
 
-def main(uri_file, out):
-    collector = Fetcher(uris=uri_file, base=out)
+def main(uri_file, out, workers=4, members=PIPELINE_MEMBERS, extract=True):
+    collector = Fetcher(uris=uri_file, base=out, workers=workers, members=members, extract=extract)
     collector.fetch()
 
 
 if __name__ == "__main__":
     config = cli().parse_args()
-    main(uri_file=config.urifile, out=config.outdir)
+    main(uri_file=config.urifile, out=config.outdir, workers=config.workers, members=config.members,
+         extract=config.extract)
@@ -0,0 +1,212 @@
+"""
+This module ingests a FoodData Central release straight into our columnar cache.
+
+Fetching a release with `project01.fetch` and then loading its tables runs
+every stage one after another: the whole archive is downloaded, then
+extracted, and only then parsed.  `ingest()` instead overlaps the stages:
+
+    download  ->  zip member decompression + CSV parse  ->  cache write
+      thread       thread                                   calling thread
+
+The archive is decompressed from the HTTP stream as it arrives (see
+`project01.archive.iter_members`), and each wanted table is parsed in chunks
+while later parts of the archive are still downloading.  The stages are
+joined by bounded queues, so a slow stage holds back the stages before it
+rather than letting data pile up in memory.
+
+Once the download ends, the parsed tables only need to be written to the
+columnar cache of their `archive.zip::member.csv` path, so they load from
+the cache straight away:
+
+    $ python -m project01.ingest https://fdc.nal.usda.gov/fdc-datasets/FoodData_Central_csv_2020-10-30.zip dataset
+"""
+
+import os
+import queue
+import tempfile
+import threading
+from typing import Dict, Iterator, Optional
+
+import requests
+
+import project01.archive as archive
+import project01.parser as food_parser
+from project01.cache import ColumnCache
+from project01.fetch import DOWNLOAD_DIR
+
+# The tables ingested by default, by member file name.
+TABLES = {
+    "branded_food.csv": food_parser.FoodBrandObject,
+    "food.csv": food_parser.FoodObject,
+}
+
+_BLOCK_SIZE = 1 << 16
+# Marks the end of the items put on a queue.
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException) -> None:
+        """Carries a stage's exception to the next stage."""
+        self.error = error
+
+
+def _put(items: queue.Queue, item, stop: threading.Event) -> None:
+    """Puts an item on a bounded queue, unless the pipeline is being stopped.
+
+    Raises:
+        InterruptedError: If the pipeline was stopped.
+    """
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            pass
+    raise InterruptedError("Ingest pipeline stopped")
+
+
+def _drain(items: queue.Queue) -> Iterator:
+    """Iterates over the items put on a queue by the previous stage.
+
+    Raises:
+        Exception: The previous stage's failure, if any.
+    """
+    while True:
+        item = items.get()
+        if item is _END:
+            return
+        if isinstance(item, _Failure):
+            raise item.error
+        yield item
+
+
+def _stage(target, out: queue.Queue, stop: threading.Event, *args) -> threading.Thread:
+    """Starts a pipeline stage on its own thread.
+
+    The stage's `target` is called with the queue to put its items on, the
+    stop event and `args`.  Its end or failure is put on the queue in turn.
+    """
+    def run():
+        try:
+            target(out, stop, *args)
+            _put(out, _END, stop)
+        except InterruptedError:
+            pass
+        except BaseException as error:
+            try:
+                _put(out, _Failure(error), stop)
+            except InterruptedError:
+                pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _download(out: queue.Queue, stop: threading.Event, uri: str, path: str) -> None:
+    """Streams an archive to disk, passing each block on as it arrives.
+
+    The archive is written to a partial file of its own, rather than the
+    `.part` file `project01.fetch` resumes, so concurrent fetch and ingest
+    runs do not write to each other's downloads.
+    """
+    downloads = os.path.join(os.path.dirname(path), DOWNLOAD_DIR)
+    os.makedirs(downloads, exist_ok=True)
+    fd, part = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".ingest", dir=downloads)
+    try:
+        with os.fdopen(fd, "wb") as fout:
+            with requests.get(uri, stream=True, headers={"Accept-Encoding": "identity"}) as resp:
+                resp.raise_for_status()
+                for block in resp.iter_content(_BLOCK_SIZE):
+                    fout.write(block)
+                    _put(out, block, stop)
+        os.replace(part, path)
+    except BaseException:
+        os.remove(part)
+        raise
+
+
+def _parse(out: queue.Queue, stop: threading.Event, blocks: queue.Queue, tables: dict, chunksize: int) -> None:
+    """Decompresses the wanted members of a zip stream and parses them in chunks."""
+    for name, fin in archive.iter_members(_drain(blocks)):
+        cls = tables.get(name.rsplit("/", 1)[-1])
+        if cls is not None:
+            for chunk in cls._parse_stream(fin, chunksize):
+                _put(out, (name, chunk), stop)
+
+
+def ingest(uri: str,
+           out: str = "dataset",
+           tables: Optional[Dict[str, type]] = None,
+           chunksize: int = 100000,
+           queue_size: int = 64,
+           feedback: bool = True) -> Dict[str, food_parser.BaseFood]:
+    """Downloads a release archive and caches its tables, overlapping each stage.
+
+    The archive is kept in the output directory, and its tables are read
+    from it with `archive.zip::member.csv` paths (see `project01.archive`).
+
+    Args:
+        uri (str): The URI of the release's zip archive.
+        out (str): The directory to save the archive to.
+        tables (dict): The food object class to load each table with, keyed by
+            the file name of its member.  Defaults to TABLES.
+        chunksize (int): The maximum number of rows parsed at a time.
+        queue_size (int): The maximum number of downloaded blocks, and of parsed
+            chunks, waiting on the next stage.
+        feedback (bool): Whether to echo the progress to screen.
+    Returns:
+        dict: A food object for each ingested table, keyed by its archive path,
+        which loads from the freshly written cache.
+    """
+    tables = tables if tables is not None else TABLES
+    os.makedirs(out, exist_ok=True)
+    path = os.path.join(out, os.path.basename(uri))
+    stop = threading.Event()
+    blocks = queue.Queue(maxsize=queue_size)
+    chunks = queue.Queue(maxsize=queue_size)
+    if feedback:
+        print("Ingesting {}".format(uri))
+    threads = [_stage(_download, blocks, stop, uri, path),
+               _stage(_parse, chunks, stop, blocks, tables, chunksize)]
+    parsed = dict()
+    try:
+        for name, chunk in _drain(chunks):
+            parsed.setdefault(name, []).append(chunk)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    ret = dict()
+    for name, parts in parsed.items():
+        cls = tables[name.rsplit("/", 1)[-1]]
+        table_path = archive.join_path(path, name)
+        df = cls._combine_chunks(parts)
+        ColumnCache(table_path, cls._table, cls.schema()).write(df)
+        if feedback:
+            print("Cached {} ({} rows)".format(table_path, len(df)))
+        ret[table_path] = cls(table_path)
+    return ret
+
+
+def cli():
+    """Creates a CLI parser
+
+    Returns:
+        argparse.ArgumentParser: An Argument Parser configured to support ingest.
+    """
+    import argparse
+    parser = argparse.ArgumentParser("Ingest a dataset")
+
+    parser.add_argument("uri",
+                        help="URI of the release archive to ingest.")
+    parser.add_argument("outdir", nargs="?",
+                        default="dataset",
+                        help="Path to a directory to save the archive to.")
+    return parser
+
+
+if __name__ == "__main__":
+    config = cli().parse_args()
+    ingest(config.uri, out=config.outdir)
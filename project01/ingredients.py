@@ -0,0 +1,512 @@
+"""
+This module contains the data structures used to query the ingredient
+lists of our food tables without re-parsing their raw strings.
+
+The ingredients of a product are stored as a single delimited string.
+Rather than splitting that string again for every question we ask of it,
+a `TokenStore` splits every ingredients string once, in the same way as
+`project01.parser.find_index_from_str`, and keeps the result in a compact
+layout: a flat array of token ids, an array of row offsets into it, and the
+vocabulary of distinct tokens.  Rank, presence and position queries are then
+vectorized scans over these arrays.
+
+Searching for a term keeps the substring semantics of `find_index_from_str`,
+so "corn syrup" also matches "high fructose corn syrup solids".  A `Matcher`
+locates many terms at once with an Aho-Corasick automaton, which costs a
+single scan over each string however many terms it holds; it pays off for
+long lists of terms, while a few terms are found faster one at a time.
+"""
+
+import os
+from collections import deque
+from typing import Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from project01.cache import decode_text, encode_text
+
+# The largest number of strings `TokenStore.rank_many` searches for with one
+# substring scan of the vocabulary each.  Python's `in` runs in C, while a
+# `Matcher` steps through every character in Python, so the scans win until
+# about 30 strings on a 100,000 token vocabulary.
+_SCAN_TERMS = 24
+
+
+class Matcher:
+    def __init__(self, terms: Iterable[str]) -> None:
+        """An Aho-Corasick automaton finding many substrings in one scan.
+
+        Terms are matched without regard to case.
+
+        Args:
+            terms (Iterable[str]): The strings to search for.
+        """
+        self._terms = [term.lower() for term in terms]
+        self._goto = [dict()]
+        self._fail = [0]
+        outputs = [set()]
+        for term_id, term in enumerate(self._terms):
+            node = 0
+            for char in term:
+                if char not in self._goto[node]:
+                    self._goto.append(dict())
+                    self._fail.append(0)
+                    outputs.append(set())
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            outputs[node].add(term_id)
+        # Breadth first, so the failure links of shallower states are known.
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                outputs[child] |= outputs[self._fail[child]]
+        self._outputs = [tuple(sorted(out)) for out in outputs]
+
+    @property
+    def terms(self) -> List[str]:
+        """Provides the lower-cased terms, indexed by term id.
+        """
+        return list(self._terms)
+
+    def search(self, text: str) -> Set[int]:
+        """Finds which terms occur in a string.
+
+        Args:
+            text (str): The string to scan, in any case.
+        Returns:
+            set(int): The ids of the terms found in the string.
+        """
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = set(outputs[0])
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if outputs[node]:
+                found.update(outputs[node])
+        return found
+
+    def first_ranks(self, delimited_string: str, split: str = ",") -> List[int]:
+        """Finds the rank of every term in a delimited string.
+
+        This matches calling `find_index_from_str` once per term.
+
+        Args:
+            delimited_string (str): The string to operate against.
+            split (str): The delimiter to use to split the source string.
+        Returns:
+            list(int): The rank of each term, or -1 where it is not found.
+        """
+        ranks = [-1] * len(self._terms)
+        remaining = len(self._terms)
+        for rank, token in enumerate(str(delimited_string).split(split), start=1):
+            for term_id in self.search(token.strip()):
+                if ranks[term_id] < 0:
+                    ranks[term_id] = rank
+                    remaining -= 1
+            if not remaining:
+                break
+        return ranks
+
+
+class TokenStore:
+    def __init__(self,
+                 tokens: np.ndarray,
+                 offsets: np.ndarray,
+                 vocab: np.ndarray,
+                 labels: Optional[np.ndarray] = None) -> None:
+        """A CSR-style store of the tokenized values of a column.
+
+        The tokens of row `i` are `vocab[tokens[offsets[i]:offsets[i + 1]]]`.
+
+        Args:
+            tokens (np.ndarray): The vocabulary id of every token, row after row.
+            offsets (np.ndarray): The position in `tokens` where each row starts,
+                followed by the total number of tokens.
+            vocab (np.ndarray): The distinct tokens.
+            labels (np.ndarray): The index label of each row.  Defaults to the
+                row numbers.
+        """
+        self._tokens = tokens
+        self._offsets = offsets
+        self._vocab = vocab
+        self._labels = labels if labels is not None else np.arange(len(offsets) - 1)
+        self._rows = None
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sep: str = ",") -> "TokenStore":
+        """Tokenizes a column of delimited strings.
+
+        Each value is split on `sep`, and each token is stripped and lower-cased,
+        as done by `find_index_from_str`.
+
+        Args:
+            series (pd.Series): The column to tokenize.
+            sep (str): The delimiter to split the column's values against.
+        Returns:
+            TokenStore: The tokenized column, labelled with the series' index.
+        """
+        lists = [value.split(sep) for value in series.astype(str)]
+        lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        codes, vocab = pd.factorize([token.strip().lower() for lst in lists for token in lst])
+        return cls(codes.astype(np.int32), offsets, np.asarray(vocab, dtype=object), series.index.to_numpy())
+
+    @classmethod
+    def load(cls, path: str) -> "TokenStore":
+        """Loads a store written by `save`.
+
+        Args:
+            path (str): The path of the saved store.
+        Returns:
+            TokenStore: The loaded store.
+        """
+        with np.load(path) as arrays:
+            vocab = decode_text(arrays["vocab_blob"], arrays["vocab_offsets"], arrays["vocab_nulls"])
+            return cls(arrays["tokens"], arrays["offsets"], vocab, arrays["labels"])
+
+    def save(self, path: str) -> None:
+        """Persists the store to disk.
+
+        Args:
+            path (str): The path to write the store to.
+        """
+        vocab = {"vocab_" + part: values for part, values in encode_text(self._vocab).items()}
+        staging = path + ".tmp.npz"
+        np.savez(staging, tokens=self._tokens, offsets=self._offsets, labels=self._labels, **vocab)
+        os.replace(staging, path)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def tokens(self) -> np.ndarray:
+        """Provides the flat array of token ids.
+        """
+        return self._tokens
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """Provides the offsets of each row into the token ids.
+        """
+        return self._offsets
+
+    @property
+    def vocab(self) -> np.ndarray:
+        """Provides the distinct tokens, indexed by token id.
+        """
+        return self._vocab
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Provides the index label of each row.
+        """
+        return self._labels
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Provides the row number of every token.
+        """
+        if self._rows is None:
+            self._rows = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self._offsets))
+        return self._rows
+
+    def row_tokens(self, row: int) -> Tuple[str, ...]:
+        """Provides the tokens of a single row.
+
+        Args:
+            row (int): The row number.
+        Returns:
+            tuple(str): The row's tokens, in order.
+        """
+        return tuple(self._vocab[self._tokens[self._offsets[row]:self._offsets[row + 1]]])
+
+    def matching_tokens(self, find: str) -> np.ndarray:
+        """Establishes which tokens of the vocabulary contain a string.
+
+        Args:
+            find (str): The string to search for, in any case.
+        Returns:
+            np.ndarray: A boolean mask over the vocabulary.
+        """
+        key = find.lower()
+        return np.fromiter((key in token for token in self._vocab), dtype=bool, count=len(self._vocab))
+
+    def positions(self, find: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Locates every token containing a string.
+
+        Args:
+            find (str): The string to search for, in any case.
+        Returns:
+            tuple(np.ndarray, np.ndarray): The row number and the 1-based rank of
+            each matching token, in row order.
+        """
+        hits = self.matching_tokens(find)[self._tokens]
+        ranks = np.arange(len(self._tokens)) - self._offsets[self.rows] + 1
+        return self.rows[hits], ranks[hits]
+
+    def rank(self, find: str, labels: Optional[Iterable] = None) -> np.ndarray:
+        """Finds the rank of the first token of each row containing a string.
+
+        This matches `find_index_from_str` for every row of the store.
+
+        Args:
+            find (str): The string to search for, in any case.
+            labels (Iterable): Only return the ranks of the rows with these
+                index labels, in this order.  Defaults to every row.
+        Returns:
+            np.ndarray: The rank of each row, or -1 where the string is not found.
+        """
+        rows, ranks = self.positions(find)
+        # Rows are in order, so the first hit of each row holds its lowest rank.
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        result = np.full(len(self), -1, dtype=np.int64)
+        result[rows[first]] = ranks[first]
+        return result if labels is None else result[self.locate(labels)]
+
+    def rank_many(self, finds: Iterable[str], labels: Optional[Iterable] = None) -> np.ndarray:
+        """Finds the rank of several strings at once.
+
+        The vocabulary is scanned once per string for short lists, or a single
+        time with a `Matcher` for long ones, after which the ranks of every
+        string are gathered from the token ids together.
+
+        Args:
+            finds (Iterable[str]): The strings to search for, in any case.
+            labels (Iterable): Only return the ranks of the rows with these
+                index labels, in this order.  Defaults to every row.
+        Returns:
+            np.ndarray: A (rows, strings) array of ranks, holding -1 where a
+            string is not found.
+        """
+        finds = list(finds)
+        width = len(finds)
+        # A (vocabulary, strings) mask of the tokens containing each string.
+        if width <= _SCAN_TERMS:
+            found = np.zeros((len(self._vocab), width), dtype=bool)
+            for term, find in enumerate(finds):
+                found[:, term] = self.matching_tokens(find)
+        else:
+            matcher = Matcher(finds)
+            vocab_terms = [matcher.search(token) for token in self._vocab]
+            found = np.zeros((len(self._vocab), width), dtype=bool)
+            found[np.repeat(np.arange(len(vocab_terms)), [len(terms) for terms in vocab_terms]),
+                  np.fromiter((term for terms in vocab_terms for term in terms), dtype=np.int64)] = True
+        # Establish a CSR mapping of vocabulary ids to the terms they contain.
+        term_counts = found.sum(axis=1)
+        term_starts = np.cumsum(term_counts) - term_counts
+        term_ids = np.nonzero(found)[1].astype(np.int64)
+        # Expand every token occurrence into one entry per term it contains.
+        per_token = term_counts[self._tokens]
+        occurrence = np.repeat(np.arange(len(self._tokens), dtype=np.int64), per_token)
+        within = np.arange(len(occurrence)) - np.repeat(np.cumsum(per_token) - per_token, per_token)
+        terms = term_ids[term_starts[self._tokens[occurrence]] + within]
+        rows = self.rows[occurrence]
+        ranks = occurrence - self._offsets[rows] + 1
+        # Occurrences are in row and rank order, so the first entry of each
+        # (row, term) pair holds its lowest rank.
+        cells, first = np.unique(rows * width + terms, return_index=True)
+        result = np.full(len(self) * width, -1, dtype=np.int64)
+        result[cells] = ranks[first]
+        result = result.reshape(len(self), width)
+        return result if labels is None else result[self.locate(labels)]
+
+    def contains(self, find: str, labels: Optional[Iterable] = None) -> np.ndarray:
+        """Establishes which rows have a token containing a string.
+
+        Args:
+            find (str): The string to search for, in any case.
+            labels (Iterable): Only return the rows with these index labels.
+        Returns:
+            np.ndarray: A boolean mask over the rows.
+        """
+        return self.rank(find, labels) > 0
+
+    def locate(self, labels: Iterable) -> np.ndarray:
+        """Maps index labels to row numbers of the store.
+
+        Args:
+            labels (Iterable): The index labels to map.
+        Returns:
+            np.ndarray: The row number of each label.
+        """
+        positions = pd.Index(self._labels).get_indexer(labels)
+        if (positions < 0).any():
+            raise KeyError("Labels are not part of the token store.")
+        return positions
+
+
+class InvertedIndex:
+    def __init__(self,
+                 vocab: np.ndarray,
+                 starts: np.ndarray,
+                 rows: np.ndarray,
+                 positions: np.ndarray,
+                 labels: np.ndarray) -> None:
+        """An inverted index of ingredients to the rows listing them.
+
+        The postings of ingredient `vocab[i]` are the row numbers
+        `rows[starts[i]:starts[i + 1]]` and the 1-based positions at which the
+        ingredient is listed in those rows, sorted by row and then position.
+
+        Args:
+            vocab (np.ndarray): The distinct ingredients.
+            starts (np.ndarray): Where the postings of each ingredient start,
+                followed by the total number of postings.
+            rows (np.ndarray): The row number of each posting.
+            positions (np.ndarray): The position of each posting.
+            labels (np.ndarray): The index label of each row number.
+        """
+        self._vocab = vocab
+        self._lookup = {term: pos for pos, term in enumerate(vocab)}
+        self._starts = starts
+        self._rows = rows
+        self._positions = positions
+        self._labels = labels
+
+    @classmethod
+    def from_series(cls, ingredients: pd.Series) -> "InvertedIndex":
+        """Indexes a column of already split ingredients.
+
+        Args:
+            ingredients (pd.Series): One normalized ingredient per entry, listed in
+                order and indexed by the label of their row, such as the output
+                of `project01.parser.split_ingredients`.
+        Returns:
+            InvertedIndex: The index of the ingredients.  Empty ingredients are
+            not indexed.
+        """
+        rows, labels = pd.factorize(ingredients.index, sort=False)
+        # The entries of a row are contiguous, so positions restart at each new row.
+        row_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        lengths = np.diff(np.r_[row_starts, len(rows)])
+        positions = np.arange(len(rows)) - np.repeat(row_starts, lengths) + 1
+        values = ingredients.fillna("").to_numpy(dtype=object)
+        keep = values != ""
+        codes, vocab = pd.factorize(values[keep])
+        # A stable sort keeps each ingredient's postings in row and position order.
+        order = np.argsort(codes, kind="stable")
+        starts = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=len(vocab)), out=starts[1:])
+        return cls(np.asarray(vocab, dtype=object),
+                   starts,
+                   rows[keep][order].astype(np.int64),
+                   positions[keep][order].astype(np.int64),
+                   np.asarray(labels))
+
+    def __contains__(self, term: str) -> bool:
+        return term.lower() in self._lookup
+
+    def __len__(self) -> int:
+        return len(self._vocab)
+
+    @property
+    def vocab(self) -> np.ndarray:
+        """Provides the distinct ingredients of the index.
+        """
+        return self._vocab
+
+    def _postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        pos = self._lookup.get(term.lower())
+        if pos is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        span = slice(self._starts[pos], self._starts[pos + 1])
+        return self._rows[span], self._positions[span]
+
+    def _first(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Provides the rows listing an ingredient and where it is first listed.
+        """
+        rows, positions = self._postings(term)
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+        return rows[first], positions[first]
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Provides every listing of an ingredient.
+
+        Args:
+            term (str): The normalized ingredient, in any case.
+        Returns:
+            tuple(np.ndarray, np.ndarray): The row label and position of each
+            listing, sorted by row and then position.
+        """
+        rows, positions = self._postings(term)
+        return self._labels[rows], positions
+
+    def frequency(self, term: str) -> int:
+        """Counts the rows listing an ingredient.
+
+        Args:
+            term (str): The normalized ingredient, in any case.
+        Returns:
+            int: The number of rows listing the ingredient.
+        """
+        return len(self._first(term)[0])
+
+    def rows(self, term: str) -> np.ndarray:
+        """Finds the rows listing an ingredient.
+
+        Args:
+            term (str): The normalized ingredient, in any case.
+        Returns:
+            np.ndarray: The labels of the matching rows.
+        """
+        return self._labels[self._first(term)[0]]
+
+    def rank_range(self, term: str, floor: int = 1, ceiling: int = None) -> np.ndarray:
+        """Finds the rows which first list an ingredient within a range of positions.
+
+        For example, `rank_range("corn syrup", 1, 3)` finds the products listing
+        corn syrup among their first three ingredients.
+
+        Args:
+            term (str): The normalized ingredient, in any case.
+            floor (int): The lowest allowed position.  Defaults to 1.
+            ceiling (int): The highest allowed position.  Defaults to no limit.
+        Returns:
+            np.ndarray: The labels of the matching rows.
+        """
+        rows, positions = self._first(term)
+        keep = positions >= floor
+        if ceiling is not None:
+            keep &= positions <= ceiling
+        return self._labels[rows[keep]]
+
+    def all_of(self, *terms: str) -> np.ndarray:
+        """Finds the rows listing every one of several ingredients.
+
+        Args:
+            terms (str): The normalized ingredients, in any case.
+        Returns:
+            np.ndarray: The labels of the matching rows.
+        """
+        rows = None
+        for term in terms:
+            found = self._first(term)[0]
+            rows = found if rows is None else np.intersect1d(rows, found, assume_unique=True)
+        return self._labels[rows if rows is not None else np.empty(0, dtype=np.int64)]
+
+    def before(self, first: str, second: str) -> np.ndarray:
+        """Finds the rows listing one ingredient ahead of another.
+
+        Args:
+            first (str): The ingredient expected to be listed first.
+            second (str): The ingredient expected to be listed later.
+        Returns:
+            np.ndarray: The labels of the rows listing both ingredients, where
+            `first` is first listed ahead of `second`.
+        """
+        rows_a, positions_a = self._first(first)
+        rows_b, positions_b = self._first(second)
+        rows, at_a, at_b = np.intersect1d(rows_a, rows_b, assume_unique=True, return_indices=True)
+        return self._labels[rows[positions_a[at_a] < positions_b[at_b]]]
@@ -1,13 +1,72 @@
+"""
+This module provides lookups into the nutrient.csv table of our USDA dataset.
 
+The table is indexed once when it is loaded, so single and batched lookups
+by id, name, unit, nutrient number or rank do not scan the table.  Amounts
+can be normalized to grams one at a time, or a whole column at once.
+
+The much larger food_nutrient.csv table is loaded as a `NutrientMatrix`, a
+sparse food by nutrient matrix of normalized amounts.
+"""
+
+from typing import Iterable, List
+
+import numpy as np
 import pandas as pd
+import scipy.sparse as sp
+
+import project01.archive as archive
+
+# Readable names of the unit codes used by nutrient.csv.
+UNIT_NAMES = {
+    "G": "grams",
+    "MG": "milligrams",
+    "KCAL": "calories",
+    "IU": "international unit",
+    "UG": "micrograms"
+}
+
+# The ratio converting each mass unit code to grams.
+CONVERSION_RATIO = {
+    "G": 1,
+    "MG": 0.001,
+    "UG": 0.000001}
+
+_INDEXED = ("id", "name", "unit_name", "nutrient_nbr", "rank")
 
 
 class NutrientLookup:
     def __init__(self, csv_file):
-        self._df = pd.read_csv(csv_file, header=0)
+        """Loads and indexes the nutrient.csv table.
+
+        Args:
+            csv_file (str): The path of the nutrient.csv file, or an `archive.zip::member.csv` path.
+        """
+        self._df = archive.read_csv(csv_file, header=0)
+        self._index = {col: self._df.groupby(col, sort=False).indices for col in _INDEXED if col in self._df}
+        self._ids = pd.Index(self._df["id"])
+        self._ratios = self.unit_ratios(self._df["unit_name"]) if "unit_name" in self._df else None
+
+    def _positions(self, col, vals) -> np.ndarray:
+        index = self._index[col]
+        found = [index[val] for val in vals if val in index]
+        return np.concatenate(found) if found else np.array([], dtype=np.int64)
+
+    def _lookup(self, col, val) -> List[list]:
+        """Finds the rows with a value in a column.
+
+        Returns:
+            list(list): The values of each matching row.
+        """
+        return self._df.iloc[self._positions(col, [val])].values.tolist()
 
-    def _lookup(self, col, val):
-        return self._df[self._df[col] == val].tolist()
+    def _lookup_many(self, col, vals) -> pd.DataFrame:
+        """Finds the rows with any of several values in a column.
+
+        Returns:
+            pd.DataFrame: The matching rows, in the order of the passed values.
+        """
+        return self._df.iloc[self._positions(col, vals)]
 
     def lookup_id(self, idx):
         return self._lookup("id", idx)
@@ -24,21 +83,215 @@ class NutrientLookup:
     def lookup_rank(self, rnk):
         return self._lookup("rank", rnk)
 
+    def lookup_ids(self, ids: Iterable) -> pd.DataFrame:
+        return self._lookup_many("id", ids)
+
+    def lookup_names(self, names: Iterable[str]) -> pd.DataFrame:
+        return self._lookup_many("name", names)
+
+    def lookup_nutrient_nbrs(self, nbrs: Iterable) -> pd.DataFrame:
+        return self._lookup_many("nutrient_nbr", nbrs)
+
+    def lookup_ranks(self, rnks: Iterable) -> pd.DataFrame:
+        return self._lookup_many("rank", rnks)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Provides access to the nutrient table
+        """
+        return self._df
+
+    def positions(self, ids: Iterable) -> np.ndarray:
+        """Maps nutrient ids to their row positions in the nutrient table.
+
+        Args:
+            ids (Iterable): The nutrient ids, e.g. a nutrient_id column.
+        Returns:
+            np.ndarray: The position of each id, or -1 for unknown ids.
+        """
+        return self._ids.get_indexer(np.asarray(ids))
+
+    def normalize_amounts(self, ids: Iterable, amounts: Iterable) -> np.ndarray:
+        """Normalizes a column of amounts to grams, using their nutrients' units.
+
+        This is a single gather and multiply over the whole column, e.g. the
+        nutrient_id and amount columns of food_nutrient.csv.
+
+        Args:
+            ids (Iterable): The nutrient id of each amount.
+            amounts (Iterable): The amounts, in their nutrients' units.
+        Returns:
+            np.ndarray: The amounts in grams.  Amounts in other units, such as
+            calories, are kept as is, and those of unknown nutrients are NaN.
+        """
+        pos = self.positions(ids)
+        ratios = np.append(self._ratios, np.nan)
+        return np.asarray(amounts, dtype=np.float64) * ratios[pos]
+
+    @staticmethod
+    def unit_ratios(units: Iterable[str]) -> np.ndarray:
+        """Establishes the ratio converting each of a column of unit codes to grams.
+
+        Args:
+            units (Iterable[str]): The unit codes, e.g. the unit_name column.
+        Returns:
+            np.ndarray: The ratio of each code; 1 for codes which are not units
+            of mass.
+        """
+        codes, uniques = pd.factorize(pd.Series(units, dtype=object).str.upper())
+        table = np.array([CONVERSION_RATIO.get(unit, 1) for unit in uniques] + [1], dtype=np.float64)
+        return table[codes]
+
+    @classmethod
+    def normalize(cls, units: Iterable[str], values: Iterable) -> np.ndarray:
+        """Converts a column of values to grams, using a column of unit codes.
+
+        Args:
+            units (Iterable[str]): The unit code of each value.
+            values (Iterable): The values to convert.
+        Returns:
+            np.ndarray: The values in grams.  Values in other units, such as
+            calories, are kept as is.
+        """
+        return np.asarray(values, dtype=np.float64) * cls.unit_ratios(units)
+
     @staticmethod
     def _unit_translator(unit_code):
-        return {
-            "G": "grams",
-            "MG": "milligrams",
-            "KCAL": "calories",
-            "IU": "international unit",
-            "UG": "micrograms"
-        }[unit_code]
+        return UNIT_NAMES[unit_code]
 
     @staticmethod
     def _normalize(unit_code, value):
-        conversion_ratio = {
-            "G": 1,
-            "MG": 0.001,
-            "UG": 0.000001}[unit_code]
-        return value*conversion_ratio
+        return value*CONVERSION_RATIO[unit_code]
+
+
+class NutrientMatrix:
+    def __init__(self, matrix: sp.csr_matrix, fdc_ids: np.ndarray, lookup: NutrientLookup) -> None:
+        """A sparse matrix of the nutrient amounts of each food.
+
+        Row `i` holds the food with fdc_id `fdc_ids[i]`, and column `j` the
+        nutrient in row `j` of the lookup's nutrient table.
+
+        Args:
+            matrix (sp.csr_matrix): The amounts, normalized by the lookup.
+            fdc_ids (np.ndarray): The fdc_id of each row, in ascending order.
+            lookup (NutrientLookup): The nutrient table of the columns.
+        """
+        self._matrix = matrix
+        self._fdc_ids = fdc_ids
+        self._rows = pd.Index(fdc_ids)
+        self._lookup = lookup
+        self._csc = None
+
+    @classmethod
+    def from_csv(cls, csv_file: str, lookup: NutrientLookup, chunksize: int = 1000000) -> "NutrientMatrix":
+        """Streams the food_nutrient.csv table into a sparse matrix.
+
+        Only the fdc_id, nutrient_id and amount columns are parsed, as numbers,
+        and at most `chunksize` rows are parsed at a time.  Amounts are
+        normalized with `NutrientLookup.normalize_amounts` and stored as
+        float32; rows of nutrients missing from the lookup are dropped, and
+        repeated food and nutrient pairs are summed.
+
+        Args:
+            csv_file (str): The path of the food_nutrient.csv file, or an
+                `archive.zip::member.csv` path.
+            lookup (NutrientLookup): The nutrient table to map nutrient ids with.
+            chunksize (int): The maximum number of rows parsed at a time.
+        Returns:
+            NutrientMatrix: The matrix of the table.
+        """
+        foods, columns, amounts = [], [], []
+        dtypes = {"fdc_id": np.int64, "nutrient_id": np.int64, "amount": np.float64}
+        with archive.open_table(csv_file) as fin:
+            for chunk in pd.read_csv(fin, header=0, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize):
+                pos = lookup.positions(chunk["nutrient_id"].to_numpy())
+                known = pos >= 0
+                foods.append(chunk["fdc_id"].to_numpy()[known])
+                columns.append(pos[known].astype(np.int32))
+                amounts.append(lookup.normalize_amounts(chunk["nutrient_id"].to_numpy()[known],
+                                                        chunk["amount"].to_numpy()[known]).astype(np.float32))
+        foods = np.concatenate(foods) if foods else np.array([], dtype=np.int64)
+        rows, fdc_ids = pd.factorize(foods, sort=True)
+        matrix = sp.coo_matrix((np.concatenate(amounts) if amounts else np.array([], dtype=np.float32),
+                                (rows, np.concatenate(columns) if columns else np.array([], dtype=np.int32))),
+                               shape=(len(fdc_ids), len(lookup.df)),
+                               dtype=np.float32).tocsr()
+        matrix.sum_duplicates()
+        return cls(matrix, np.asarray(fdc_ids), lookup)
+
+    @property
+    def matrix(self) -> sp.csr_matrix:
+        """Provides the sparse matrix of amounts.
+        """
+        return self._matrix
+
+    @property
+    def fdc_ids(self) -> np.ndarray:
+        """Provides the fdc_id of each row of the matrix.
+        """
+        return self._fdc_ids
+
+    @property
+    def shape(self):
+        return self._matrix.shape
+
+    def rows(self, fdc_ids: Iterable[int]) -> sp.csr_matrix:
+        """Slices the rows of several foods.
+
+        Args:
+            fdc_ids (Iterable[int]): The foods' fdc_ids.
+        Returns:
+            sp.csr_matrix: One row per fdc_id, in the passed order.  Foods with no
+            nutrients listed have an empty row.
+        """
+        pos = self._rows.get_indexer(np.asarray(list(fdc_ids)))
+        found = self._matrix[np.where(pos >= 0, pos, 0)]
+        # Clear the rows of unknown foods.
+        return sp.diags((pos >= 0).astype(np.float32)).dot(found).tocsr()
+
+    def row(self, fdc_id: int) -> pd.Series:
+        """Provides the nutrients listed for one food.
+
+        Args:
+            fdc_id (int): The food's fdc_id.
+        Returns:
+            pd.Series: The food's normalized amounts, indexed by nutrient name.
+        """
+        found = self.rows([fdc_id])
+        names = self._lookup.df["name"].to_numpy()[found.indices]
+        return pd.Series(found.data, index=pd.Index(names, name="name"), name=fdc_id)
+
+    def column_id(self, nutrient_id: int) -> pd.Series:
+        """Extracts the amounts of one nutrient for every food.
+
+        Args:
+            nutrient_id (int): The nutrient's id.
+        Returns:
+            pd.Series: The amount of the nutrient in each food, indexed by fdc_id;
+            0 where the nutrient is not listed.
+        """
+        pos = self._lookup.positions([nutrient_id])[0]
+        if pos < 0:
+            raise KeyError(nutrient_id)
+        if self._csc is None:
+            self._csc = self._matrix.tocsc()
+        values = self._csc[:, pos].toarray().ravel()
+        return pd.Series(values, index=pd.Index(self._fdc_ids, name="fdc_id"), name=nutrient_id)
+
+    def column(self, name: str) -> pd.Series:
+        """Extracts the amounts of one nutrient, by name, for every food.
 
+        Args:
+            name (str): The nutrient's name, e.g. "Sugars, total including NLEA".
+        Returns:
+            pd.Series: See `column_id`.
+        Raises:
+            KeyError: If no nutrient has the name.
+            ValueError: If several nutrients have the name; use `column_id`.
+        """
+        ids = self._lookup.lookup_names([name])["id"].tolist()
+        if not ids:
+            raise KeyError(name)
+        if len(ids) > 1:
+            raise ValueError("{} names nutrients {}".format(name, ids))
+        return self.column_id(ids[0]).rename(name)
@@ -7,12 +7,234 @@ and each of our data tables could expand upon.
 
 """
 
+import csv
+import multiprocessing as mp
 import os
 import re
-from typing import Any, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
+import project01.archive as archive
+from project01.cache import ColumnCache
+from project01.ingredients import InvertedIndex, TokenStore
+
+# All of the USDA tables publish their dates in ISO format.
+DATE_FORMAT = "%Y-%m-%d"
+
+# Registry of the column types of each USDA table, keyed by table name.
+# Columns that are not listed are loaded as strings; listed columns which
+# are not present in a CSV file are ignored.  Date columns are converted
+# using DATE_FORMAT once the file has been read.
+SCHEMAS = {
+    "base": {
+        "fdc_id": "int64",
+    },
+    "food": {
+        "fdc_id": "int64",
+        "data_type": "category",
+        "food_category_id": "category",
+        "publication_date": "datetime64[ns]",
+    },
+    "branded_food": {
+        "fdc_id": "int64",
+        "brand_owner": "category",
+        "serving_size": "float64",
+        "serving_size_unit": "category",
+        "branded_food_category": "category",
+        "data_source": "category",
+        "modified_date": "datetime64[ns]",
+        "available_date": "datetime64[ns]",
+        "market_country": "category",
+        "discontinued_date": "datetime64[ns]",
+    },
+}
+
+
+def _compact_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """Drops the categories which no longer occur in a filtered dataframe.
+
+    Filtering a categorical column keeps every category of the original
+    column, which would otherwise show up as empty groups in value_counts()
+    and in our plots.
+
+    Args:
+        df (pd.DataFrame): The dataframe to operate on.
+    Returns:
+        pd.DataFrame: The dataframe `df`, with its categorical columns compacted.
+    """
+    # A filtered dataframe is already a new object, so pandas' chained
+    # assignment warning does not apply here.
+    with pd.option_context("mode.chained_assignment", None):
+        for col in df.select_dtypes("category").columns:
+            df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+# The dataframe, function and arguments of a worker's `run_on_df_parallel`
+# job.  It is only set in the forked workers, by `_init_partition_job`.
+_PARTITION_JOB = None
+
+
+def _init_partition_job(job: tuple) -> None:
+    """Hands a `run_on_df_parallel` job to a worker process.
+
+    Forked workers receive the job as the pool's initializer argument, so
+    the dataframe is inherited rather than pickled.
+
+    Args:
+        job (tuple): The dataframe, function, arguments and keyword arguments.
+    """
+    global _PARTITION_JOB
+    _PARTITION_JOB = job
+
+
+def _run_partition(bounds: Tuple[int, int]) -> Tuple[pd.DataFrame, List[str]]:
+    """Runs the worker's parallel job on one row partition of its dataframe.
+
+    Args:
+        bounds (tuple(int, int)): The first and one past the last row positions
+            of the partition.
+    Returns:
+        tuple: The columns the function added or changed, over the rows it
+        kept and indexed by their positions in the dataframe, and the names of
+        every column of its output, in order.
+    """
+    df, func, args, kwargs = _PARTITION_JOB
+    start, stop = bounds
+    part = pd.DataFrame(df.iloc[start:stop])
+    if not part.index.is_unique:
+        # Repeated labels cannot tell the kept rows apart, so the function
+        # sees the rows' positions instead.
+        part.index = pd.RangeIndex(start, stop)
+    out = func(part.copy(), *args, **kwargs)
+    rows = part.index.get_indexer(out.index)
+    if (rows < 0).any():
+        raise ValueError("run_on_df_parallel functions may not add rows")
+    kept = part if out.index.equals(part.index) else part.iloc[rows]
+    # Only the new values are pickled back to the parent process.
+    changed = out[[col for col in out.columns if col not in kept or not out[col].equals(kept[col])]]
+    changed.index = start + rows
+    return changed, list(out.columns)
+
+
+class _ColumnSource:
+    def __init__(self, cls: type, csv_file: str, cache: bool = True) -> None:
+        """Loads the columns of a table on demand.
+
+        Args:
+            cls (type): The BaseFood subclass whose schema types the columns.
+            csv_file (str): The path of the table's CSV file, or an
+                `archive.zip::member.csv` path (see `project01.archive`).
+            cache (bool): Whether to read and maintain the table's columnar cache.
+        """
+        self._cls = cls
+        self._csv_file = csv_file
+        self._columns = list(archive.read_csv(csv_file, header=0, nrows=0).columns)
+        self._store = ColumnCache(csv_file, cls._table, cls.schema()) if cache else None
+        self._cached = self._store is not None and self._store.is_valid()
+
+    def __contains__(self, col: str) -> bool:
+        return col in self._columns
+
+    @property
+    def columns(self) -> List[str]:
+        """Provides the columns of the table which can still be loaded.
+        """
+        return list(self._columns)
+
+    def artifact(self, name: str) -> Optional[str]:
+        """Provides a path in the table's cache for derived data.
+
+        Args:
+            name (str): The file name of the derived data.
+        Returns:
+            str: The path to use, or None if the table is not cached.
+        """
+        return self._store.artifact(name) if self._cached else None
+
+    def discard(self, col: str) -> None:
+        """Stops a column from being loaded, e.g. after it has been dropped.
+
+        Args:
+            col (str): The name of the column to forget.
+        """
+        if col in self._columns:
+            self._columns.remove(col)
+
+    def load(self, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Loads columns of the table, parsing only those missing from the cache.
+
+        Args:
+            columns (list(str)): The columns to load.  Defaults to every column.
+        Returns:
+            pd.DataFrame: The requested columns, in the table's column order.
+        """
+        if columns is None:
+            wanted = list(self._columns)
+        else:
+            unknown = [col for col in columns if col not in self._columns]
+            if unknown:
+                raise ValueError("Columns not found in {}: {}".format(self._csv_file, unknown))
+            wanted = [col for col in self._columns if col in set(columns)]
+        cached = set(self._store.columns) if self._cached else set()
+        parts = [self._store.read([col for col in wanted if col in cached])] if cached else []
+        todo = [col for col in wanted if col not in cached]
+        if todo:
+            parsed = self._cls._parse_csv(self._csv_file, todo)
+            if self._store is not None:
+                self._cached = self._store.add(parsed) if self._cached else self._store.write(parsed)
+            parts.append(parsed)
+        df = pd.concat(parts, axis=1) if len(parts) > 1 else parts[0] if parts else pd.DataFrame()
+        return df[wanted]
+
+
+class _LazyFrame(pd.DataFrame):
+    """A dataframe that loads the columns of its table the first time they are accessed.
+    """
+    _metadata = ["_source"]
+    _source = None
+
+    @property
+    def _constructor(self):
+        return _LazyFrame
+
+    def __getitem__(self, key):
+        if self._source is not None:
+            keys = [key] if isinstance(key, str) else key if isinstance(key, list) else []
+            missing = [k for k in keys if isinstance(k, str) and k not in self.columns and k in self._source]
+            if missing:
+                self.materialize(missing)
+        return super().__getitem__(key)
+
+    def _set_axis(self, axis: int, labels) -> None:
+        index = self.index
+        super()._set_axis(axis, labels)
+        # New row labels, e.g. from set_index or reset_index, no longer number
+        # the rows of the CSV file, so columns cannot be aligned on them.
+        if self._source is not None and not self.index.equals(index):
+            self._source = None
+
+    def materialize(self, columns: List[str]) -> None:
+        """Loads the passed columns into the dataframe if they are not yet present.
+
+        Loaded columns are aligned on the dataframe's index, which holds the row
+        numbers of the CSV file, so this also works on a filtered dataframe.
+        A dataframe whose row labels were replaced no longer loads columns.
+
+        Args:
+            columns (list(str)): The columns to load.
+        """
+        missing = [col for col in columns if col not in self.columns and col in self._source]
+        if not missing:
+            return
+        loaded = self._source.load(missing)
+        with pd.option_context("mode.chained_assignment", None):
+            for col in missing:
+                self[col] = loaded[col].reindex(self.index)
+
 
 class BaseFood:
     """A base object for USDA food elements.
@@ -20,21 +242,308 @@ class BaseFood:
     This object creates a common interface for all future USDA food table
     entries.
     """
-    def __init__(self, csv_file: str = None, *args, **kwargs) -> None:
-        self._df = self._parse_csv(csv_file)
+    # The SCHEMAS entry used to type the columns of this table.
+    _table = "base"
+
+    def __init__(self,
+                 csv_file: str = None,
+                 *args,
+                 columns: Optional[List[str]] = None,
+                 cache: bool = True,
+                 **kwargs) -> None:
+        source = _ColumnSource(type(self), csv_file, cache)
+        df = _LazyFrame(source.load(columns))
+        df._source = source
+        self._setup(df)
+
+    def _setup(self, df: pd.DataFrame) -> None:
+        self._df = df
+        self._fdc_index = None
         self._ingredients = None
+        self._ingredient_counts = None
+        self._token_stores = dict()
+        self._row_hashes = dict()
 
-    @staticmethod
-    def _parse_csv(csv_file: str) -> pd.DataFrame:
+    @property
+    def _df(self) -> pd.DataFrame:
+        """The object's current dataframe: the rows of its base dataframe selected
+        by filters such as `clamp` and `find_top`.  It is only built when used.
+        """
+        if self._view is None:
+            self._view = _compact_categories(self._base.take(self._rows))
+        return self._view
+
+    @_df.setter
+    def _df(self, df: pd.DataFrame) -> None:
+        self._base = df
+        self._rows = None
+        self._view = df
+
+    def _values(self, col: str) -> pd.Series:
+        """Provides a column of the current rows without building the whole dataframe.
+
+        Args:
+            col (str): The name of the column.
+        Returns:
+            pd.Series: The column's values for the current rows.
+        """
+        if self._view is not None:
+            return self._view[col]
+        return self._base[col].take(self._rows)
+
+    def _filtered(self) -> bool:
+        """Checks whether the current dataframe was built from the base dataframe.
+
+        Such a dataframe may since have been changed by the caller, e.g. with
+        added columns, which the base dataframe does not hold.
+        """
+        return self._view is not None and self._view is not self._base
+
+    def _adopt_view(self) -> None:
+        """Makes the current dataframe the base one if its rows no longer match
+        the selection, e.g. after the caller dropped rows from it in place.
+        """
+        if self._filtered() and len(self._view) != len(self._rows):
+            self._df = self._view
+
+    def _narrow(self, mask: np.ndarray) -> None:
+        """Restricts the current rows to those selected by a mask.
+
+        Only the row positions into the base dataframe are updated; the
+        base dataframe itself is left untouched.  A current dataframe which
+        was already built is narrowed as well, so changes made to it are kept.
+
+        Args:
+            mask (np.ndarray): A boolean mask over the current rows.
+        """
+        self._adopt_view()
+        self._rows = np.flatnonzero(mask) if self._rows is None else self._rows[mask]
+        self._view = _compact_categories(self._view[mask]) if self._filtered() else None
+
+    def branch(self) -> "BaseFood":
+        """Establishes a new object over the same data and current rows.
+
+        No data is copied: both objects share the values of their base
+        dataframe, and filtering one of them, or adding columns to it, does
+        not affect the other.
+
+        Returns:
+            BaseFood: A new object of the same class.
+        """
+        obj = type(self).__new__(type(self))
+        obj.__dict__.update(self.__dict__)
+        # A shallow copy shares the data but keeps added columns apart.
+        obj._df = self._base.copy(deep=False)
+        obj._rows = self._rows
+        if self._filtered():
+            obj._view = self._view.copy(deep=False)
+        else:
+            obj._view = obj._base if self._rows is None else None
+        obj._token_stores = dict(self._token_stores)
+        obj._row_hashes = dict(self._row_hashes)
+        return obj
+
+    def query(self) -> "Query":
+        """Starts a lazy query over the object's current rows.
+
+        Returns:
+            project01.query.Query: An empty query; see `project01.query`.
+        """
+        from project01.query import Query
+        return Query(self)
+
+    def _selection(self) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+        """Provides the base dataframe and the positions of the current rows.
+
+        Returns:
+            tuple: The base dataframe, and the selected row positions or None
+            when every row is selected.
+        """
+        if self._filtered():
+            # The current dataframe may hold changes the base dataframe lacks.
+            return self._view, None
+        return self._base, self._rows
+
+    def reset(self) -> pd.DataFrame:
+        """Drops all filters applied with `clamp` and `find_top`.
+
+        Changes made to the filtered dataframe, rather than through
+        `run_on_df`, are not carried over to the unfiltered one.
+
+        Returns:
+            pd.DataFrame: The unfiltered dataframe.
+        """
+        self._rows = None
+        self._view = self._base
+        return self._df
+
+    @classmethod
+    def schema(cls) -> Dict[str, str]:
+        """Provides the column types used when loading this table.
+
+        Returns:
+            dict: A mapping of column name to pandas dtype name.
+        """
+        return SCHEMAS[cls._table]
+
+    @classmethod
+    def _parse_csv(cls, csv_file: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
         """Establishes a pandas dataframe of the passed CSV file
 
+        Columns are typed according to the class's schema at parse time,
+        so identifiers are integers, low-cardinality text is categorical
+        and dates are datetime64.
+
         Args:
             csv_file (str): A string representing the path of the CSV file
                to load
+            columns (list(str)): Only parse these columns.  Defaults to every column.
         Returns:
            pd.DataFrame: The CSV file loaded as a dataframe.
         """
-        return pd.read_csv(csv_file, header=0, dtype=object)
+        dtypes, dates = cls._csv_dtypes(csv_file, columns)
+        df = archive.read_csv(csv_file, header=0, usecols=list(dtypes), dtype=dtypes)
+        return cls._convert_dates(df, dates)
+
+    @classmethod
+    def _parse_csv_chunks(cls,
+                          csv_file: str,
+                          chunksize: int,
+                          columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """Parses the passed CSV file in chunks of at most `chunksize` rows.
+
+        Each chunk is typed the same way as `_parse_csv`, and is indexed by the
+        row numbers of the CSV file.
+
+        Args:
+            csv_file (str): A string representing the path of the CSV file
+               to load
+            chunksize (int): The maximum number of rows per chunk.
+            columns (list(str)): Only parse these columns.  Defaults to every column.
+        Yields:
+           pd.DataFrame: The next chunk of the CSV file.
+        """
+        dtypes, dates = cls._csv_dtypes(csv_file, columns)
+        with archive.open_table(csv_file) as fin:
+            for chunk in pd.read_csv(fin, header=0, usecols=list(dtypes), dtype=dtypes, chunksize=chunksize):
+                yield cls._convert_dates(chunk, dates)
+
+    @classmethod
+    def _csv_dtypes(cls, csv_file: str, columns: Optional[List[str]] = None) -> Tuple[Dict[str, Any], List[str]]:
+        """Establishes the read_csv dtypes of the columns to parse from the CSV file.
+
+        Returns:
+            tuple: The dtype of each column to parse, and the date columns which
+                are read as strings and converted afterwards.
+        """
+        header = archive.read_csv(csv_file, header=0, nrows=0).columns
+        return cls._header_dtypes(header, columns)
+
+    @classmethod
+    def _header_dtypes(cls,
+                       header: Iterable[str],
+                       columns: Optional[List[str]] = None) -> Tuple[Dict[str, Any], List[str]]:
+        """Establishes the read_csv dtypes of the columns named in a CSV header.
+
+        Returns:
+            tuple: The dtype of each column to parse, and the date columns which
+                are read as strings and converted afterwards.
+        """
+        schema = cls.schema()
+        dtypes = {col: schema.get(col, object) for col in header if columns is None or col in columns}
+        dates = [col for col, kind in dtypes.items() if kind == "datetime64[ns]"]
+        dtypes.update({col: object for col in dates})
+        return dtypes, dates
+
+    @classmethod
+    def _parse_stream(cls, fin, chunksize: int) -> Iterator[pd.DataFrame]:
+        """Parses every column of a binary CSV stream in chunks.
+
+        This reads a stream which cannot be re-opened, such as an archive member
+        being downloaded.  Columns are typed as by `_parse_csv`, except that
+        categorical columns are left as strings, as each chunk would otherwise
+        hold its own categories; `_combine_chunks` types them.
+
+        Args:
+            fin: The binary stream, positioned at the CSV header.
+            chunksize (int): The maximum number of rows per chunk.
+        Yields:
+            pd.DataFrame: The next chunk of the stream.
+        """
+        header = next(csv.reader([fin.readline().decode("utf-8-sig")]))
+        dtypes, dates = cls._header_dtypes(header)
+        dtypes.update({col: object for col, kind in dtypes.items() if kind == "category"})
+        for chunk in pd.read_csv(fin, header=None, names=header, dtype=dtypes, chunksize=chunksize):
+            yield cls._convert_dates(chunk, dates)
+
+    @classmethod
+    def _combine_chunks(cls, chunks: List[pd.DataFrame]) -> pd.DataFrame:
+        """Combines the chunks produced by `_parse_stream` into the whole table.
+
+        Returns:
+            pd.DataFrame: The table, typed as `_parse_csv` would type it.
+        """
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+        for col, kind in cls.schema().items():
+            if kind == "category" and col in df:
+                df[col] = df[col].astype("category")
+        return df
+
+    @staticmethod
+    def _convert_dates(df: pd.DataFrame, dates: List[str]) -> pd.DataFrame:
+        for col in dates:
+            df[col] = pd.to_datetime(df[col], format=DATE_FORMAT, errors="coerce")
+        return df
+
+    @classmethod
+    def from_df(cls, df: pd.DataFrame) -> "BaseFood":
+        """Establishes a food object around an already loaded dataframe.
+
+        Args:
+            df (pd.DataFrame): The dataframe the object operates on.
+        Returns:
+            BaseFood: A new object of the calling class.
+        """
+        obj = cls.__new__(cls)
+        obj._setup(df)
+        return obj
+
+    @classmethod
+    def stream(cls,
+               csv_file: str,
+               chunksize: int = 100000,
+               columns: Optional[List[str]] = None) -> Iterator["BaseFood"]:
+        """Iterates over the CSV file in bounded-size chunks.
+
+        Only one chunk is held in memory at a time, so reductions over the
+        whole table should be computed from mergeable partial results, e.g.
+        with `partial_counts` and `merge_counts`.
+
+        Args:
+            csv_file (str): A string representing the path of the CSV file
+               to load
+            chunksize (int): The maximum number of rows per chunk.
+            columns (list(str)): Only load these columns.  Defaults to every column.
+        Yields:
+            BaseFood: An object of the calling class for the next chunk.
+        """
+        for chunk in cls._parse_csv_chunks(csv_file, chunksize, columns):
+            yield cls.from_df(chunk)
+
+    def _require(self, columns: List[str]) -> None:
+        """Ensures the passed columns have been loaded into the dataframe.
+
+        Args:
+            columns (list(str)): The columns a method is about to use.
+        """
+        if isinstance(self._base, _LazyFrame) and self._base._source is not None:
+            self._base.materialize(columns)
+            self._adopt_view()
+            if self._filtered():
+                with pd.option_context("mode.chained_assignment", None):
+                    for col in columns:
+                        if col not in self._view and col in self._base:
+                            self._view[col] = self._base[col].take(self._rows).array
 
     def _filter(self, col: str, val: Any) -> pd.DataFrame:
         """Returns the rows of the dataframe which have the passed value in the specified column.
@@ -56,7 +565,37 @@ class BaseFood:
             pd.DataFrame: The subset of the datatframe that matches the passed ID.
 
         """
-        return self._filter("fdc_id", idx)
+        return self.find_by_fdcids([idx])
+
+    def find_by_fdcids(self, ids: Iterable[int]) -> pd.DataFrame:
+        """Returns the records whose fdc_id matches any of the passed id values.
+
+        Lookups go through a hash index on fdc_id, which is built on first use
+        and rebuilt whenever the dataframe changes, rather than scanning the
+        whole dataframe for each id.  Ids may be passed as integers or as
+        strings.
+
+        Args:
+            ids (Iterable[int]): The Index IDs to look up.
+        Returns:
+            pd.DataFrame: The matching records, in the order of the passed ids.
+                Ids which are not found are skipped.
+        """
+        keys = pd.to_numeric(pd.Series(list(ids), dtype=object), errors="coerce").dropna()
+        positions = self._fdc_lookup().get_indexer_for(keys)
+        return self._df.iloc[positions[positions >= 0]]
+
+    def _fdc_lookup(self) -> pd.Index:
+        """Provides the index of fdc_id values to row positions.
+
+        Returns:
+            pd.Index: The fdc_id of each row, as numbers.
+        """
+        frame, length, index = self._fdc_index if self._fdc_index is not None else (None, None, None)
+        if frame is not self._df or length != len(self._df):
+            index = pd.Index(pd.to_numeric(self._df["fdc_id"], errors="coerce"))
+            self._fdc_index = (self._df, len(self._df), index)
+        return index
 
     @property
     def df(self) -> pd.DataFrame:
@@ -64,10 +603,132 @@ class BaseFood:
         """
         return self._df
 
+    def tokens(self, col: str = "ingredients", sep: str = ",") -> TokenStore:
+        """Provides the tokenized values of a column.
+
+        For a table loaded from a CSV file, the whole column is tokenized once
+        and persisted in the table's cache, so later objects of the same file
+        reuse it.  The store covers every row of the file, and so stays valid
+        as the dataframe is filtered.
+
+        Args:
+            col (str): The name of the column to tokenize.
+            sep (str): The delimiter to split the column's values against.
+        Returns:
+            TokenStore: The tokenized column.
+        """
+        key = (col, sep)
+        if key not in self._token_stores:
+            source = self._base._source if isinstance(self._base, _LazyFrame) else None
+            if source is None or col not in source:
+                self._token_stores[key] = TokenStore.from_series(self._df[col], sep)
+            else:
+                path = source.artifact("tokens.{}.{}.npz".format(col, sep.encode("utf-8").hex()))
+                if path is not None and os.path.exists(path):
+                    self._token_stores[key] = TokenStore.load(path)
+                else:
+                    store = TokenStore.from_series(source.load([col])[col], sep)
+                    if path is not None:
+                        store.save(path)
+                    self._token_stores[key] = store
+        return self._token_stores[key]
+
+    def row_hashes(self, col: str = "ingredients") -> np.ndarray:
+        """Provides a hash of each current row's value in a column.
+
+        The column is hashed once with `pd.util.hash_pandas_object`.  For a
+        table loaded from a CSV file, every row of the file is hashed, as done
+        by `tokens`, and the hashes are persisted in the table's cache; the
+        current rows are then found by their index labels, the row numbers of
+        the file.  Equal values have equal hashes, in any object or release,
+        so rows whose value changed are found by comparing hashes.
+
+        Args:
+            col (str): The name of the column to hash.
+        Returns:
+            np.ndarray: The uint64 hash of each current row.
+        """
+        source = self._base._source if isinstance(self._base, _LazyFrame) else None
+        if source is None or col not in source:
+            if col not in self._row_hashes:
+                self._row_hashes[col] = pd.util.hash_pandas_object(self._base[col], index=False).to_numpy()
+            hashes = self._row_hashes[col]
+            return hashes if self._rows is None else hashes[self._rows]
+        if col not in self._row_hashes:
+            path = source.artifact("hashes.{}.npy".format(col))
+            if path is not None and os.path.exists(path):
+                self._row_hashes[col] = np.load(path)
+            else:
+                hashes = pd.util.hash_pandas_object(source.load([col])[col], index=False).to_numpy()
+                if path is not None:
+                    np.save(path, hashes)
+                self._row_hashes[col] = hashes
+        labels = self._base.index if self._rows is None else self._base.index.take(self._rows)
+        return self._row_hashes[col][labels.to_numpy()]
+
     def run_on_df(self, func, *args, **kwargs):
         self._df = func(self._df, *args, **kwargs)
+        # func may have changed the dataframe in place.
+        self._fdc_index = None
+        self._token_stores.clear()
+        self._row_hashes.clear()
+        self._ingredient_counts = None
         return self._df
 
+    def run_on_df_parallel(self,
+                           func,
+                           *args,
+                           processes: Optional[int] = None,
+                           partitions: Optional[int] = None,
+                           **kwargs):
+        """Runs a row-wise function over the dataframe on several processes.
+
+        The dataframe is split into contiguous row partitions and `func` is
+        mapped over them on a pool of forked processes, which read their
+        partition from the memory they share with this process rather than
+        receiving a pickled copy.  Only the columns `func` added or changed are
+        sent back, and joined onto the dataframe by row position.  `func` must
+        therefore treat each row independently, as `insert_index` does, and may
+        drop rows but not add any.  Columns not yet loaded are loaded up front,
+        as the workers cannot load them.  Where forking is not available, this
+        falls back to `run_on_df`.
+
+        Args:
+            func: The function to run, called as `func(df, *args, **kwargs)`.
+            processes (int): The number of worker processes.  Defaults to the
+                number of CPUs.
+            partitions (int): The number of row partitions.  Defaults to the
+                number of processes.
+        Returns:
+            pd.DataFrame: The reassembled output of `func`.
+        """
+        processes = processes or os.cpu_count() or 1
+        partitions = max(1, min(partitions or processes, len(self._df)))
+        if processes < 2 or partitions < 2 or "fork" not in mp.get_all_start_methods():
+            return self.run_on_df(func, *args, **kwargs)
+        if isinstance(self._base, _LazyFrame) and self._base._source is not None:
+            # The workers cannot load columns, so they get all of them.
+            self._require(self._base._source.columns)
+        df = self._df
+        bounds = np.linspace(0, len(df), partitions + 1).astype(np.int64)
+        with ProcessPoolExecutor(processes,
+                                 mp_context=mp.get_context("fork"),
+                                 initializer=_init_partition_job,
+                                 initargs=((df, func, args, kwargs),)) as pool:
+            parts = list(pool.map(_run_partition, zip(bounds[:-1], bounds[1:])))
+        # Rows are reassembled by position, as labels may repeat.
+        positions = np.concatenate([part.index.to_numpy() for part, _ in parts])
+        whole = len(positions) == len(df) and bool((positions == np.arange(len(df))).all())
+        result = df.copy(deep=False) if whole else df.take(positions)
+        changed = list(dict.fromkeys(col for part, _ in parts for col in part.columns))
+        with pd.option_context("mode.chained_assignment", None):
+            for col in changed:
+                # A partition where the column was left as is sends nothing back.
+                values = pd.concat([part[col] if col in part else df[col].take(part.index) for part, _ in parts],
+                                   ignore_index=True)
+                result[col] = values.array
+        return self.run_on_df(lambda _: result[parts[0][1]])
+
     def cleanup(self) -> pd.DataFrame:
         """Cleans up dataset based upon EDA analysis.
 
@@ -88,12 +749,16 @@ class BaseFood:
                 Defaults to the maximum value in the column.
             col (str): The column name to operate on.  Defaults to corn_syrup_idx.
 
+        The filter is recorded as a selection of rows over the object's base
+        dataframe, which is not modified; see `branch` and `reset`.
+
         Returns:
             pd.DataFrame: A new dataframe, where only the rows within the values
                 of floor and ceiling are included, and all others are dropped.
         """
-        ceil = ceiling if ceiling is not None else self._df[col].max() + 1
-        self._df = self._df[(self._df[col] > floor) & (self._df[col] < ceil)]
+        values = self._values(col)
+        ceil = ceiling if ceiling is not None else values.max() + 1
+        self._narrow(((values > floor) & (values < ceil)).to_numpy())
         return self._df
 
     def find_top(self,
@@ -104,27 +769,44 @@ class BaseFood:
         Args:
             limit (int): The total number of records to return from the dataset.
             col (str): The column to find the top occurances of.
+        The filter is recorded as a selection of rows over the object's base
+        dataframe, which is not modified; see `branch` and `reset`.
+
         Returns:
             pd.DataFrame: A filtered dataframe containing only the foods
             in the top five largest categories.
         """
-        top_series = self._df[col].value_counts().nlargest(limit)
+        values = self._values(col)
+        top_series = values.value_counts().nlargest(limit)
         top_names = top_series.index.array
-        self._df = self._df[self._df[col].isin(top_names)]
+        self._narrow(values.isin(top_names).to_numpy())
         return self._df
 
     def __str__(self) -> str:
         return self._df.__str__()
 
 
+# The columns of branded_food.csv that the question drivers and cleanup() use.
+ANALYSIS_COLUMNS = ["fdc_id", "brand_owner", "ingredients", "serving_size",
+                    "serving_size_unit", "branded_food_category"]
+
+
 class FoodObject(BaseFood):
-    def __init__(self, csv_file: str = None) -> None:
+    _table = "food"
+
+    def __init__(self,
+                 csv_file: str = None,
+                 columns: Optional[List[str]] = None,
+                 cache: bool = True) -> None:
         """An object implementation of the food.csv data table.
 
         Args:
            csv_file (str): A string that direccts to the food.csv file.
+           columns (list(str)): The columns to load up front.  Other columns are
+               loaded the first time they are accessed.  Defaults to every column.
+           cache (bool): Whether to use the columnar cache of the file.
         """
-        super().__init__(csv_file)
+        super().__init__(csv_file, columns=columns, cache=cache)
 
     def find_by_group(self, grp: str) -> pd.DataFrame:
         """Finds all records that match the passed group.
@@ -141,13 +823,49 @@ class FoodObject(BaseFood):
 
 
 class FoodBrandObject(BaseFood):
-    def __init__(self, csv_file: str = None) -> None:
+    _table = "branded_food"
+
+    def __init__(self,
+                 csv_file: str = None,
+                 columns: Optional[List[str]] = None,
+                 cache: bool = True) -> None:
         """Establishs a new FoodBrand object based on the food_brand.csv file
 
         Args:
             csv_file (str): A string that specifies the path of the food_brands.csv file.
+            columns (list(str)): The columns to load up front.  Other columns are
+                loaded the first time they are accessed.  Defaults to every column.
+            cache (bool): Whether to use the columnar cache of the file.
+        """
+        super().__init__(csv_file, columns=columns, cache=cache)
+
+    @classmethod
+    def stream(cls,
+               csv_file: str,
+               chunksize: int = 100000,
+               columns: Optional[List[str]] = None,
+               finds: Iterable[str] = (),
+               cleanup: bool = True) -> Iterator["FoodBrandObject"]:
+        """Iterates over the branded food table in bounded-size, prepared chunks.
+
+        Each chunk is cleaned up and has an index column inserted for each
+        of the `finds` terms, as would be done on the whole table.
+
+        Args:
+            csv_file (str): A string that specifies the path of the food_brands.csv file.
+            chunksize (int): The maximum number of rows per chunk.
+            columns (list(str)): Only load these columns.  Defaults to every column.
+            finds (Iterable[str]): The ingredients to insert an index column for.
+            cleanup (bool): Whether to run `cleanup()` on each chunk.
+        Yields:
+            FoodBrandObject: An object for the next chunk.
         """
-        super().__init__(csv_file)
+        for bfood in super().stream(csv_file, chunksize=chunksize, columns=columns):
+            if cleanup:
+                bfood.cleanup()
+            for find in finds:
+                bfood.run_on_df(insert_index, find=find)
+            yield bfood
 
     def find_by_brandowner(self, brand: str = None) -> pd.DataFrame:
         """Finds all records owned by a particular brand.
@@ -162,59 +880,252 @@ class FoodBrandObject(BaseFood):
     def cleanup(self) -> pd.DataFrame:
         """Cleans up dataset based upon EDA analysis.
 
+        Dates are already typed by the table's schema when the file is parsed.
+
         Returns:
             pd.DataFrame: The cleaned dataframe.
         """
-        self._df['modified_date'] = pd.to_datetime(self._df['modified_date'], format="%Y-%m-%d")
-        self._df['available_date'] = pd.to_datetime(self._df['available_date'], format='%Y-%m-%d')
-        # self._df['discontinued_date'] = pd.to_datetime(self._df['discontinued_date'], format='%Y-%m-%d')
-        del self._df['discontinued_date']
-        self._df.dropna(how='all')
-        self._df.dropna(subset=['brand_owner', 'ingredients', 'serving_size',
-                                'serving_size_unit', 'branded_food_category'], inplace=True)
+        required = ['brand_owner', 'ingredients', 'serving_size',
+                    'serving_size_unit', 'branded_food_category']
+        self._require(required)
+        df = self._df
+        df.drop(columns=['discontinued_date'], errors='ignore', inplace=True)
+        if isinstance(df, _LazyFrame) and df._source is not None:
+            df._source.discard('discontinued_date')
+        df.dropna(how='all')
+        df.dropna(subset=required, inplace=True)
+        self._df = _compact_categories(df)
         return self._df
 
+    def inverted_index(self) -> InvertedIndex:
+        """Establishes an inverted index of the dataframe's ingredients.
+
+        Ingredients are normalized as done by `get_all_ingredients`, and the
+        index's postings hold the dataframe's index labels.
+
+        Returns:
+            InvertedIndex: The index of each ingredient's products and positions.
+        """
+        return InvertedIndex.from_series(split_ingredients(self._df["ingredients"]))
+
     def get_all_ingredients(self):
         """Parses the entire ingridents series of the dataframe to establish a list of all ingredients.
 
         Returns:
            set: A set of the ingredients within the dataframe.
         """
-        def clean(ing):
-            """Performs simple splitting and parsing of an ingredients list.
-
-            Args:
-                ing (str): a string representing a product's ingriedents list.
-
-            Returns:
-                tuple: A split list of ingredients after being normalized for later processing.
-            """
-            # Strip paren text
-            # Remove paren and bracket text
-            cleaned1 = re.sub(r'[\(\[].*?[\)\]]', "", str(ing))  # noqa
-            # Remove residual punctuation, save our "comma" delimiter
-            cleaned2 = re.sub(r'[#.:\-*?!&}{\]\[\(\)"]', "", cleaned1)  # noqa
-            # Return a tuple split on the comma, removing whitespace
-            pt1 = list(i.strip() for i in cleaned2.lower().split(","))
-            # Split on nested semicolon list for ingredients
-            pt2 = list(i.strip() for lst in pt1 for i in lst.split(";"))
-            # Split on subsequent ingredients
-            pt3 = list(i.strip() for lst in pt2 for i in lst.split(":"))
-            # Split on "statement" ingredients
-            pt4 = list(i.strip() for lst in pt3 for i in lst.split("."))
-            # Return as an immutable type to make converting to a set easier
-            return tuple(pt4) 
-        # Unfold the list into a flattened set and then back to a list (for ease of access)
-        self._ingredients = tuple(set(x.strip() for lst in self._df["ingredients"].apply(clean).tolist() for x in lst))
+        # Counting the flattened ingredients also establishes the distinct set.
+        self._seed_ingredient_counts(split_ingredients(self._df["ingredients"]).value_counts())
         return self._ingredients
 
+    def ingredient_frequencies(self) -> pd.Series:
+        """Counts how often each ingredient is listed in the dataframe.
+
+        The counts are established along with `get_all_ingredients`.
+
+        Returns:
+            pd.Series: The number of times each ingredient is listed, largest first.
+        """
+        if self._known_ingredient_counts() is None:
+            self.get_all_ingredients()
+        return self._ingredient_counts[2]
+
+    def _known_ingredient_counts(self) -> Optional[pd.Series]:
+        """Provides the ingredient frequencies, if they were already established
+        for the current dataframe.
+        """
+        frame, length, counts = self._ingredient_counts if self._ingredient_counts is not None else (None, None, None)
+        if frame is not self._df or length != len(self._df):
+            return None
+        return counts
+
+    def _seed_ingredient_counts(self, counts: pd.Series) -> None:
+        """Adopts ingredient frequencies established elsewhere, e.g. by
+        `project01.release.refresh` from those of a previous release.
+
+        Args:
+            counts (pd.Series): The number of times each ingredient is listed, largest first.
+        """
+        # Keyed on the dataframe, as filters and `run_on_df` replace it.
+        self._ingredient_counts = (self._df, len(self._df), counts)
+        self._ingredients = tuple(counts.index)
+
 
-def load(csv_dir: Optional[str] = "dataset") -> List[FoodObject]:
-    ret = list()
+# Parenthesized and bracketed text, such as sub-ingredient lists.
+_NESTED_TEXT = r'[\(\[].*?[\)\]]'
+# Residual punctuation.  Our "comma" and "semicolon" delimiters are kept.
+_PUNCTUATION = r'[#.:\-*?!&}{\]\[\(\)"]'
 
-    for base_dir in os.listdir(csv_dir):
-        ret.append(FoodObject(os.path.join(csv_dir, base_dir, "food.csv")))
-    return ret
+
+def clean_ingredients(ing: str) -> Tuple[str, ...]:
+    """Performs simple splitting and parsing of an ingredients list.
+
+    Args:
+        ing (str): a string representing a product's ingriedents list.
+
+    Returns:
+        tuple: A split list of ingredients after being normalized for later processing.
+    """
+    # Remove paren and bracket text
+    cleaned1 = re.sub(_NESTED_TEXT, "", str(ing))
+    # Remove residual punctuation, save our "comma" delimiter
+    cleaned2 = re.sub(_PUNCTUATION, "", cleaned1)
+    # Split on the comma and on nested semicolon lists, removing whitespace.
+    # The ":" and "." delimiters were removed along with the punctuation.
+    return tuple(i.strip() for i in cleaned2.lower().replace(";", ",").split(","))
+
+
+def split_ingredients(series: pd.Series) -> pd.Series:
+    """Splits a column of ingredients lists into its normalized ingredients.
+
+    This applies `clean_ingredients` to the whole column at once, using
+    pandas' vectorized string methods.
+
+    Args:
+        series (pd.Series): The ingredients column to operate on.
+
+    Returns:
+        pd.Series: One ingredient per row, in the order they are listed, and
+        indexed by the label of the row they were listed in.
+    """
+    cleaned = (series.astype(str)
+               .str.replace(_NESTED_TEXT, "", regex=True)
+               .str.replace(_PUNCTUATION, "", regex=True)
+               .str.lower()
+               .str.replace(";", ",", regex=False))
+    return cleaned.str.split(",").explode().str.strip()
+
+
+def partial_counts(df: pd.DataFrame, col: str) -> pd.Series:
+    """Counts the values of a column of one chunk of a table.
+
+    Args:
+        df (pd.DataFrame): The chunk to operate on.
+        col (str): The column to count the values of.
+    Returns:
+        pd.Series: The number of occurrences of each value, in the order
+        value_counts() ranks tied values: by first occurrence, or by category
+        for a categorical column.  Combine those of several chunks using
+        `merge_counts`.
+    """
+    counts = df[col].value_counts(sort=False)
+    counts = counts[counts > 0]
+    counts.index = counts.index.astype(object)
+    counts.attrs["categorical"] = isinstance(df[col].dtype, pd.CategoricalDtype)
+    return counts
+
+
+def merge_counts(counts: Iterable[pd.Series]) -> pd.Series:
+    """Combines the partial value counts of several chunks.
+
+    Tied values are ranked as value_counts() ranks them on the whole table:
+    by their first occurrence in the table or, for a categorical column, in
+    the order of its categories, which are sorted when a table is parsed.
+
+    Args:
+        counts (Iterable[pd.Series]): The output of `partial_counts` for each chunk,
+            in the order of the chunks.
+    Returns:
+        pd.Series: The value counts over all chunks, largest first, as would be
+        returned by value_counts() on the whole table.
+    """
+    parts = list(counts)
+    if not parts:
+        return pd.Series([], dtype="int64")
+    # Summing in order of first appearance keeps each value's first occurrence.
+    total = pd.concat(parts).groupby(level=0, sort=False).sum()
+    if any(part.attrs.get("categorical") for part in parts):
+        total = total.sort_index()
+    # value_counts() sorts its unsorted counts the same way.
+    return total.astype("int64").sort_values(ascending=False)
+
+
+def describe_counts(counts: pd.Series) -> pd.Series:
+    """Produces the describe() output of a non-numeric column from its value counts.
+
+    Args:
+        counts (pd.Series): The value counts of the column, largest first.
+    Returns:
+        pd.Series: The count, unique, top and freq statistics of the column.
+    """
+    return pd.Series([counts.sum(),
+                      len(counts),
+                      counts.index[0] if len(counts) else None,
+                      counts.iloc[0] if len(counts) else None],
+                     index=["count", "unique", "top", "freq"],
+                     name=counts.name,
+                     dtype=object)
+
+
+# The food object class of each table `load` can parse.
+_LOAD_CLASSES = {
+    "food": FoodObject,
+    "branded_food": FoodBrandObject,
+}
+
+
+def _load_table(job: Tuple[str, str, Optional[List[str]]]) -> pd.DataFrame:
+    """Parses the table of one release, in a worker process of `load`.
+
+    Args:
+        job (tuple): The table's path, the table's name and the columns to load.
+    Returns:
+        pd.DataFrame: The parsed table.
+    """
+    path, table, columns = job
+    return pd.DataFrame(_LOAD_CLASSES[table](path, columns=columns).df)
+
+
+def load(csv_dir: Optional[str] = "dataset",
+         how: str = "list",
+         table: str = "food",
+         columns: Optional[List[str]] = None,
+         processes: Optional[int] = None) -> Union[List[BaseFood], pd.DataFrame, Dict[str, pd.DataFrame]]:
+    """Loads a table of each release in a directory.
+
+    A release is either an extracted directory or a zip archive, whose
+    members are read without extracting them; see
+    `project01.release.releases`.
+
+    By default, a lazily loaded food object is returned per release.
+    Otherwise the releases are parsed concurrently, one per process of a pool
+    of forked processes, so loading takes about as long as the largest
+    release rather than the sum of all of them.  Each worker also fills the
+    release's columnar cache.
+
+    Args:
+        csv_dir (str): The directory holding the releases.
+        how (str): "list" for a list of food objects, "dict" for a dict of
+            dataframes keyed by release name, or "frame" for a single dataframe
+            with a categorical `release` column.
+        table (str): The table to load, "food" or "branded_food".
+        columns (list(str)): The columns to parse for "dict" and "frame".
+            Defaults to every column.
+        processes (int): The number of worker processes.  Defaults to one per
+            release, up to the number of CPUs.
+    Returns:
+        The table of each release, ordered by release, as set by `how`.
+    """
+    # The release module builds on this one.
+    from project01.release import releases
+    if how not in ("list", "dict", "frame"):
+        raise ValueError("Unknown load output {}".format(how))
+    catalogs = [catalog for catalog in releases(csv_dir) if catalog.path(table) is not None]
+    if how == "list":
+        return [catalog.table(table) for catalog in catalogs]
+    jobs = [(catalog.path(table), table, columns) for catalog in catalogs]
+    processes = max(1, min(processes or os.cpu_count() or 1, len(jobs)))
+    if processes < 2 or "fork" not in mp.get_all_start_methods():
+        frames = [_load_table(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(processes, mp_context=mp.get_context("fork")) as pool:
+            frames = list(pool.map(_load_table, jobs))
+    names = [catalog.name for catalog in catalogs]
+    if how == "dict":
+        return dict(zip(names, frames))
+    df = _LOAD_CLASSES[table]._combine_chunks(frames)
+    df.insert(0, "release", pd.Categorical(np.repeat(names, [len(frame) for frame in frames]), categories=names))
+    return df
 
 
 def find_index_from_str(delimited_string: str, fnd: str, split: str = ","):
@@ -246,6 +1157,17 @@ def find_index_from_str(delimited_string: str, fnd: str, split: str = ","):
     return rank
 
 
+def index_column(find: str) -> str:
+    """Provides the name of the ranked index column inserted for a search string.
+
+    Args:
+        find (str): The string searched for.
+    Returns:
+        str: The column name, e.g. corn_syrup_idx for "corn syrup".
+    """
+    return "".join([find.replace(" ", "_").lower(), "_idx"])
+
+
 def insert_index(df: pd.DataFrame,
                  find: str,
                  col: str = "ingredients",
@@ -266,6 +1188,38 @@ def insert_index(df: pd.DataFrame,
         with the index value specified.  Note that if the value is not found, the
         column's value will be less than 0.
     """
-    newcol = "".join([find.replace(" ", "_").lower(), "_idx"])
-    df[newcol] = df[col].apply(find_index_from_str, fnd=find, split=sep)
+    return insert_indices(df, [find], col=col, sep=sep)
+
+
+def insert_indices(df: pd.DataFrame,
+                   finds: Iterable[str],
+                   col: str = "ingredients",
+                   sep: str = ",",
+                   store: Optional[TokenStore] = None) -> pd.DataFrame:
+    """Augments dataframe to add a ranked index column for each of several strings.
+
+    The column's values are split and normalized once, as `find_index_from_str`
+    would, and all of the strings are located in a single scan over the
+    distinct values of the split column, so adding terms does not re-parse
+    the column.
+
+    Args:
+        df (pd.DataFrame: The dataframe to operate on.
+        finds (Iterable[str]): The strings to search for
+        col (str): The name of the column to operate on in the dataframe.
+        sep (str): The delimiter to split the column's values against.
+        store (TokenStore): An already tokenized copy of the column, such as
+            `BaseFood.tokens()`, whose labels cover the dataframe's index.
+            Defaults to tokenizing the column.
+
+    Returns:
+        pd.DataFrame: The mutated dataframe `df` with a new column named `find`_idx
+        for each string, holding the same values `insert_index` would.
+    """
+    finds = list(finds)
+    labels = df.index if store is not None else None
+    store = store if store is not None else TokenStore.from_series(df[col], sep)
+    ranks = store.rank_many(finds, labels)
+    for pos, find in enumerate(finds):
+        df[index_column(find)] = ranks[:, pos]
     return df
@@ -0,0 +1,249 @@
+"""
+This module provides a lazy query API over our food objects.
+
+The methods of `project01.parser.BaseFood` run eagerly: each call to
+`insert_index`, `clamp` or `find_top` works on, and builds, a whole
+dataframe.  A `Query` instead records the operations of an analysis, e.g.
+
+    bfood.query().rank("corn syrup").clamp(0, 10).top("brand_owner", 10).collect()
+
+and only runs them when `collect()` is called.  Before running, the plan is
+optimized:
+
+  * Filters which do not read a ranked index column are moved ahead of the
+    ranking, so ingredients are only ranked for the rows that survive them.
+  * Consecutive rankings of the same column share a single tokenizing pass.
+  * Only the columns read by the plan or selected for the output are read
+    from the table.
+"""
+
+from collections import namedtuple
+from typing import Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import project01.parser as food_parser
+from project01.ingredients import TokenStore
+
+# An operation of a query plan.  `reads` lists the columns the operation
+# reads, `writes` the column it derives (if any), and `filters` is True for
+# operations which drop rows.
+_Op = namedtuple("_Op", ["kind", "reads", "writes", "filters", "args"])
+
+
+class Query:
+    def __init__(self, source: Any, ops: tuple = (), selected: Optional[tuple] = None) -> None:
+        """A lazy query over a food table.
+
+        Queries are immutable; every method returns a new query.
+
+        Args:
+            source: The `BaseFood` object to query, or a function taking the
+                list of columns to load (or None for all) and returning one.
+            ops (tuple): The operations recorded so far.
+            selected (tuple): The columns to output.  Defaults to every column.
+        """
+        self._source = source
+        self._ops = ops
+        self._selected = selected
+
+    def _add(self, op: _Op) -> "Query":
+        return Query(self._source, self._ops + (op,), self._selected)
+
+    def _last_rank(self) -> str:
+        for op in reversed(self._ops):
+            if op.kind == "rank":
+                return op.writes
+        return "corn_syrup_idx"
+
+    def rank(self, find: str, col: str = "ingredients", sep: str = ",") -> "Query":
+        """Adds a ranked index column for a string, as `insert_index` does.
+
+        Args:
+            find (str): The string to search for
+            col (str): The name of the column to operate on in the dataframe.
+            sep (str): The delimiter to split the column's values against.
+        Returns:
+            Query: The extended query.
+        """
+        return self._add(_Op("rank", (col,), food_parser.index_column(find), False, (find, col, sep)))
+
+    def clamp(self, floor: int = 0, ceiling: int = None, col: str = None) -> "Query":
+        """Keeps the rows whose column lies between two values, as `BaseFood.clamp` does.
+
+        Args:
+            floor (int): The lowest allowed value of the column. Defaults to 0.
+            ceiling (int): The highest allowed value in the column.
+                Defaults to the maximum value in the column.
+            col (str): The column name to operate on.  Defaults to the most
+                recently ranked column.
+        Returns:
+            Query: The extended query.
+        """
+        col = col if col is not None else self._last_rank()
+        return self._add(_Op("clamp", (col,), None, True, (floor, ceiling, col)))
+
+    def top(self, col: str = "branded_food_category", limit: int = 5) -> "Query":
+        """Keeps the rows of the most common values of a column, as `BaseFood.find_top` does.
+
+        Args:
+            col (str): The column to find the top occurances of.
+            limit (int): The number of values to keep.
+        Returns:
+            Query: The extended query.
+        """
+        return self._add(_Op("top", (col,), None, True, (col, limit)))
+
+    def where(self, col: str, val: Any) -> "Query":
+        """Keeps the rows which have the passed value in a column.
+
+        Args:
+            col (str): The name of the column.
+            val (Any): The value to keep.
+        Returns:
+            Query: The extended query.
+        """
+        return self._add(_Op("where", (col,), None, True, (col, val)))
+
+    def dropna(self, *cols: str) -> "Query":
+        """Drops the rows which are missing a value in any of the passed columns.
+
+        Args:
+            cols (str): The names of the columns.
+        Returns:
+            Query: The extended query.
+        """
+        return self._add(_Op("dropna", tuple(cols), None, True, tuple(cols)))
+
+    def select(self, *cols: str) -> "Query":
+        """Restricts the output to the passed columns.
+
+        Args:
+            cols (str): The names of the columns to output.
+        Returns:
+            Query: The restricted query.
+        """
+        return Query(self._source, self._ops, tuple(cols))
+
+    def plan(self) -> List[_Op]:
+        """Establishes the optimized order of the query's operations.
+
+        A filter moves ahead of any rankings before it, unless it reads a
+        ranked column.  Filters are never reordered among themselves, as
+        e.g. `top` depends on the rows which reach it.
+
+        Returns:
+            list: The operations, in the order they will run.
+        """
+        plan = []
+        for op in self._ops:
+            pos = len(plan)
+            if op.filters:
+                while pos and plan[pos - 1].kind == "rank" and plan[pos - 1].writes not in op.reads:
+                    pos -= 1
+            plan.insert(pos, op)
+        return plan
+
+    def columns(self) -> Optional[List[str]]:
+        """Establishes the columns of the table the query reads.
+
+        Returns:
+            list(str): The columns to load, or None if every column is needed.
+        """
+        if self._selected is None:
+            return None
+        derived = {op.writes for op in self._ops if op.writes}
+        needed = [col for op in self._ops for col in op.reads] + list(self._selected)
+        return list(dict.fromkeys(col for col in needed if col not in derived))
+
+    def _load(self) -> food_parser.BaseFood:
+        if isinstance(self._source, food_parser.BaseFood):
+            return self._source
+        return self._source(self.columns())
+
+    def collect(self) -> pd.DataFrame:
+        """Runs the query.
+
+        Returns:
+            pd.DataFrame: The rows which pass every filter, with the selected
+            columns and the ranked columns.
+        """
+        base, rows = self._load()._selection()
+        rows = np.arange(len(base)) if rows is None else rows
+        derived = dict()
+
+        def values(col: str) -> np.ndarray:
+            return derived[col] if col in derived else base[col].take(rows).to_numpy()
+
+        plan = self.plan()
+        pos = 0
+        while pos < len(plan):
+            op = plan[pos]
+            if op.kind == "rank":
+                # Rank consecutive strings of the same column in one pass.
+                batch = [op]
+                while (pos + len(batch) < len(plan) and plan[pos + len(batch)].kind == "rank"
+                       and plan[pos + len(batch)].args[1:] == op.args[1:]):
+                    batch.append(plan[pos + len(batch)])
+                find, col, sep = op.args
+                store = TokenStore.from_series(pd.Series(values(col), dtype=object), sep)
+                ranks = store.rank_many([item.args[0] for item in batch])
+                for idx, item in enumerate(batch):
+                    derived[item.writes] = ranks[:, idx]
+                pos += len(batch)
+                continue
+            keep = self._mask(op, values)
+            rows = rows[keep]
+            derived = {col: arr[keep] for col, arr in derived.items()}
+            pos += 1
+
+        out_cols = list(self._selected) if self._selected is not None else list(base.columns) + list(derived)
+        df = pd.DataFrame({col: (derived[col] if col in derived else base[col].take(rows).array)
+                           for col in out_cols},
+                          index=base.index.take(rows),
+                          columns=out_cols)
+        return food_parser._compact_categories(df)
+
+    @staticmethod
+    def _mask(op: _Op, values) -> np.ndarray:
+        """Evaluates a filter over the current rows.
+
+        Returns:
+            np.ndarray: A boolean mask of the rows to keep.
+        """
+        if op.kind == "clamp":
+            floor, ceiling, col = op.args
+            vals = values(col)
+            # As in `BaseFood.clamp`, missing values are skipped and an empty
+            # selection has no maximum, which keeps no rows.
+            ceil = ceiling if ceiling is not None else pd.Series(vals).max() + 1
+            return np.asarray((vals > floor) & (vals < ceil), dtype=bool)
+        if op.kind == "top":
+            col, limit = op.args
+            vals = pd.Series(values(col))
+            top_names = vals.value_counts().nlargest(limit).index.array
+            return vals.isin(top_names).to_numpy()
+        if op.kind == "where":
+            col, val = op.args
+            return np.asarray(values(col) == val, dtype=bool)
+        keep = np.ones(len(values(op.reads[0])) if op.reads else 0, dtype=bool)
+        for col in op.reads:
+            keep &= pd.notna(values(col))
+        return keep
+
+
+def scan(csv_file: str, cls: type = food_parser.FoodBrandObject, **kwargs) -> Query:
+    """Starts a lazy query over a CSV file.
+
+    The file is only read when the query is collected, and then only the
+    columns the query needs are loaded.
+
+    Args:
+        csv_file (str): The path of the CSV file.
+        cls (type): The food object class to load the file with.
+        kwargs: Further arguments for the class, e.g. `cache`.
+    Returns:
+        Query: An empty query.
+    """
+    return Query(lambda columns: cls(csv_file, columns=columns, **kwargs))
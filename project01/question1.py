@@ -13,6 +13,7 @@ import pandas as pd
 import seaborn as sns
 
 import project01.parser as food_parser
+from project01.session import AnalysisSession
 
 
 def establish_food_object_cornsyrup(csv_file: str) -> food_parser.FoodBrandObject:
@@ -26,7 +27,7 @@ def establish_food_object_cornsyrup(csv_file: str) -> food_parser.FoodBrandObjec
             contains the parsed dataframe with corn syrup already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
     cornsyrup = bfood.run_on_df(food_parser.insert_index, "corn syrup", "ingredients")
     return cornsyrup
@@ -44,7 +45,7 @@ def establish_food_object_hfcs(csv_file: str) -> food_parser.FoodBrandObject:
             already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
     hfcs = bfood.run_on_df(food_parser.insert_index, "high fructose corn syrup", "ingredients")
     return hfcs
@@ -137,11 +138,21 @@ def main(csv_file: str):
     Returns:
         None: catplot is written out to file.
     """
-    cornsyrup = establish_food_object_cornsyrup(csv_file)
-    plot_cornsyrup(cornsyrup, out="q1-cornsyrup.png")
+    run(AnalysisSession(csv_file, terms=["corn syrup", "high fructose corn syrup"]))
 
-    hfcs = establish_food_object_hfcs(csv_file)
-    plot_hfcs(hfcs, out="q1-hfcs.png")
+
+def run(session: AnalysisSession):
+    """Produces the output of `main()` from a shared analysis session.
+
+    Args:
+        session (AnalysisSession): A session ranking corn syrup and
+            high fructose corn syrup.
+
+    Returns:
+        None: catplot is written out to file.
+    """
+    plot_cornsyrup(session.df, out="q1-cornsyrup.png")
+    plot_hfcs(session.df, out="q1-hfcs.png")
 
 
 if __name__ == "__main__":
@@ -16,6 +16,7 @@ from matplotlib import pyplot as plt
 from typing import List
 
 import project01.parser as food_parser
+from project01.session import AnalysisSession
 
 
 def establish_food_object_cornsyrup(csv_file: str) -> food_parser.FoodBrandObject:
@@ -29,7 +30,7 @@ def establish_food_object_cornsyrup(csv_file: str) -> food_parser.FoodBrandObjec
             contains the parsed dataframe with corn syrup already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
     bfood.run_on_df(food_parser.insert_index, find="corn syrup")
     return bfood
@@ -46,7 +47,7 @@ def establish_food_object_sugar(csv_file: str) -> food_parser.FoodBrandObject:
             contains the parsed dataframe with sugar already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
     bfood.run_on_df(food_parser.insert_index, find="sugar")
     return bfood
@@ -120,6 +121,34 @@ def metrics_on_brands(df: pd.DataFrame,
     return [df[col].describe(), df[col].value_counts()]
 
 
+def stream_metrics_on_brands(csv_file: str,
+                            col: str = "brand_owner",
+                            limit: int = 10,
+                            chunksize: int = 100000) -> List[List[pd.Series]]:
+    """Produces the brand metrics of `main()` without loading the whole table.
+
+    The file is processed in chunks of `chunksize` rows, so peak memory is
+    bounded by the chunk size rather than by the size of the file.
+
+    Args:
+        csv_file (str): The path to the branded_foods.csv file.
+        col (str): The column to perform analysis on.  Default: brand_owner.
+        limit (int): The number of top brands to report metrics on.
+        chunksize (int): The maximum number of rows held in memory at once.
+
+    Returns:
+        list[list[pd.Series]]: The output of `metrics_on_brands` on the whole
+        cleaned table, followed by its output on the top `limit` brands.
+    """
+    chunks = food_parser.FoodBrandObject.stream(csv_file,
+                                                chunksize=chunksize,
+                                                columns=food_parser.ANALYSIS_COLUMNS)
+    counts = food_parser.merge_counts(food_parser.partial_counts(chunk.df, col) for chunk in chunks)
+    top = counts.iloc[:limit]
+    return [[food_parser.describe_counts(counts), counts],
+            [food_parser.describe_counts(top), top]]
+
+
 def plot_cornsyrup(df: pd.DataFrame, out: str = "plot.png"):
     """Creates a violin plot of the distribution of data.
 
@@ -188,7 +217,20 @@ def main(csv_file: str):
         None: Output to the terminal statistics and various
         plots are written out to file.
     """
-    bfood_cornsyrup = establish_food_object_cornsyrup(csv_file)
+    run(AnalysisSession(csv_file, terms=["corn syrup", "sugar"]))
+
+
+def run(session: AnalysisSession):
+    """Produces the output of `main()` from a shared analysis session.
+
+    Args:
+        session (AnalysisSession): A session ranking corn syrup and sugar.
+
+    Returns:
+        None: Output to the terminal statistics and various
+        plots are written out to file.
+    """
+    bfood_cornsyrup = session.food()
     print("metrics on brands with corn syrup:")
     pprint.pprint(metrics_on_brands(bfood_cornsyrup.df))
     df_cornsyrup = find_top_ten_brands(bfood_cornsyrup)
@@ -203,7 +245,7 @@ def main(csv_file: str):
 
     print("---------------")
 
-    bfood_sugar = establish_food_object_sugar(csv_file)
+    bfood_sugar = session.food()
     print("metrics on brands with sugar:")
     pprint.pprint(metrics_on_brands(bfood_sugar.df))
     df_sugar = find_top_ten_brands(bfood_sugar)
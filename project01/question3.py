@@ -17,6 +17,7 @@ from matplotlib import pyplot as plt
 from typing import List
 
 import project01.parser as food_parser
+from project01.session import AnalysisSession
 
 
 def establish_food_object(csv_file: str) -> food_parser.FoodBrandObject:
@@ -30,10 +31,9 @@ def establish_food_object(csv_file: str) -> food_parser.FoodBrandObject:
             contains the parsed dataframe with corn syrup already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
-    bfood.run_on_df(food_parser.insert_index, find="corn syrup")
-    bfood.run_on_df(food_parser.insert_index, find="sugar")
+    bfood.run_on_df(food_parser.insert_indices, finds=["corn syrup", "sugar"])
     return bfood
 
 
@@ -183,7 +183,20 @@ def main(csv_file: str):
         None: Output to the terminal statistics and various
         plots are written out to file.
     """
-    bfood = establish_food_object(csv_file)
+    run(AnalysisSession(csv_file, terms=["corn syrup", "sugar"]))
+
+
+def run(session: AnalysisSession):
+    """Produces the output of `main()` from a shared analysis session.
+
+    Args:
+        session (AnalysisSession): A session ranking corn syrup and sugar.
+
+    Returns:
+        None: Output to the terminal statistics and various
+        plots are written out to file.
+    """
+    bfood = session.food()
     df = find_top_five_food_categories(bfood)
     print(metrics_on_food_categories(bfood.df))
     # Very wide range, adjusted to 10 as this seems to match most index returns.
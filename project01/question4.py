@@ -12,6 +12,7 @@ import pandas as pd
 import seaborn as sns
 
 import project01.parser as food_parser
+from project01.session import AnalysisSession
 
 
 def establish_food_object_cornsyrup(csv_file: str) -> food_parser.FoodBrandObject:
@@ -25,7 +26,7 @@ def establish_food_object_cornsyrup(csv_file: str) -> food_parser.FoodBrandObjec
             contains the parsed dataframe with corn syrup already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
     cornsyrup = bfood.run_on_df(food_parser.insert_index, "corn syrup", "ingredients")
     return cornsyrup
@@ -42,7 +43,7 @@ def establish_food_object_sugar(csv_file: str) -> food_parser.FoodBrandObject:
             contains the parsed dataframe with sugar already added as
             a new index.
     """
-    bfood = food_parser.FoodBrandObject(csv_file)
+    bfood = food_parser.FoodBrandObject(csv_file, columns=food_parser.ANALYSIS_COLUMNS)
     bfood.cleanup()
     sugar = bfood.run_on_df(food_parser.insert_index, "sugar", "ingredients")
     return sugar
@@ -95,11 +96,20 @@ def main(csv_file: str):
     Returns:
         None: catplot is written out to file.
     """
-    cornsyrup = establish_food_object_cornsyrup(csv_file)
-    plot_cornsyrup(cornsyrup, out="q4-cornsyrup.png")
+    run(AnalysisSession(csv_file, terms=["corn syrup", "sugar"]))
 
-    sugar = establish_food_object_sugar(csv_file)
-    plot_sugar(sugar, out="q4-sugar.png")
+
+def run(session: AnalysisSession):
+    """Produces the output of `main()` from a shared analysis session.
+
+    Args:
+        session (AnalysisSession): A session ranking corn syrup and sugar.
+
+    Returns:
+        None: catplot is written out to file.
+    """
+    plot_cornsyrup(session.df, out="q4-cornsyrup.png")
+    plot_sugar(session.df, out="q4-sugar.png")
 
 
 if __name__ == "__main__":
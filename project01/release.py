@@ -0,0 +1,425 @@
+"""
+This module supports processing successive FoodData Central releases.
+
+A `Catalog` gives access to the tables of one release, whether extracted or
+still zipped, loading each table on first use and keeping the joins between
+tables once computed:
+
+    catalog = release.Catalog("dataset/FoodData_Central_csv_2020-10-30")
+    catalog.find_by_group("Candy")              # branded_food joined with food
+    catalog.branded_nutrients()                 # branded_food joined with food_nutrient
+
+Each monthly release of the branded food table repeats most of the previous
+release's products unchanged.  Rather than ranking the ingredients of every
+product again, `refresh()` diffs the new release against the previously
+processed one by fdc_id and modified_date, and only ranks the products which
+were added or changed:
+
+    old = session_food                      # a ranked FoodBrandObject
+    new = release.refresh(old, "dataset/FoodData_Central_csv_2020-10-30/branded_food.csv",
+                          ["corn syrup", "sugar"])
+
+`rank_changes()` compares the ingredient ranks of the same products, matched
+by gtin_upc, in two releases.  Only the products whose ingredients text
+changed are tokenized and ranked:
+
+    moved = release.rank_changes(old, new, ["corn syrup"])
+    moved[moved["delta"] < 0]               # moved corn syrup up their list
+"""
+
+import os
+import zipfile
+from collections import namedtuple
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import project01.archive as archive
+import project01.parser as food_parser
+from project01.ingredients import TokenStore
+from project01.lookup import NutrientLookup, NutrientMatrix
+
+# The differences between two releases of a table.  `matches` holds, for each
+# row of the new release, the position of the same unchanged row in the
+# previous release, or -1 where the row was added or changed.  The other
+# fields list the fdc_id of the added, changed and removed rows.
+Delta = namedtuple("Delta", ["matches", "added", "changed", "removed"])
+
+
+def diff(previous: pd.DataFrame,
+         current: pd.DataFrame,
+         key: str = "fdc_id",
+         stamp: str = "modified_date") -> Delta:
+    """Compares two releases of a table.
+
+    A row is unchanged when a row with the same key and modification stamp
+    exists in the previous release.
+
+    Args:
+        previous (pd.DataFrame): The previously processed release.
+        current (pd.DataFrame): The new release.
+        key (str): The column identifying a row across releases.
+        stamp (str): The column holding the date a row was last modified.
+    Returns:
+        Delta: The matching rows and the keys of the added, changed and
+        removed rows.
+    """
+    prev_keys = pd.Index(previous[key].to_numpy())
+    cur_keys = current[key].to_numpy()
+    found = prev_keys.get_indexer(cur_keys)
+    known = found >= 0
+    prev_stamps = previous[stamp].to_numpy()[found[known]]
+    cur_stamps = current[stamp].to_numpy()[known]
+    same = (prev_stamps == cur_stamps) | (pd.isna(prev_stamps) & pd.isna(cur_stamps))
+    changed = np.flatnonzero(known)[~same]
+    matches = found.copy()
+    matches[changed] = -1
+    return Delta(matches=matches,
+                 added=cur_keys[~known],
+                 changed=cur_keys[changed],
+                 removed=prev_keys[~prev_keys.isin(cur_keys)].to_numpy())
+
+
+def refresh(previous: food_parser.FoodBrandObject,
+            csv_file: str,
+            finds: Iterable[str],
+            col: str = "ingredients",
+            sep: str = ",",
+            columns: Optional[List[str]] = food_parser.ANALYSIS_COLUMNS,
+            cleanup: bool = True) -> food_parser.FoodBrandObject:
+    """Processes a new release of the branded food table incrementally.
+
+    The ranked index columns of unchanged rows are copied from the previous
+    release, and only the added and changed rows are tokenized and ranked.
+    Terms the previous release was not ranked for are ranked for every row.
+    If the previous release's ingredient frequencies were established, they
+    are updated from the added, changed and removed rows alone.
+
+    Args:
+        previous (FoodBrandObject): The previously processed release, with an
+            index column for the `finds` terms (see `insert_indices`).
+        csv_file (str): The path to the new release's branded_food.csv file.
+        finds (Iterable[str]): The strings to insert a ranked index column for.
+        col (str): The name of the column to rank the strings in.
+        sep (str): The delimiter to split the column's values against.
+        columns (list(str)): The columns to load up front.  fdc_id,
+            modified_date and `col` are always loaded.
+        cleanup (bool): Whether to run `cleanup()` on the new release, as was
+            done on the previous one.
+    Returns:
+        FoodBrandObject: The new release, with a ranked index column for each
+        of the `finds` terms.
+    """
+    finds = list(finds)
+    if columns is not None:
+        columns = list(dict.fromkeys(list(columns) + ["fdc_id", "modified_date", col]))
+    bfood = food_parser.FoodBrandObject(csv_file, columns=columns)
+    if cleanup:
+        bfood.cleanup()
+    prev_df = previous.df
+    df = bfood.df
+    delta = diff(prev_df, df)
+    stale = delta.matches < 0
+    kept = delta.matches[~stale]
+
+    reused = [find for find in finds if food_parser.index_column(find) in prev_df]
+    fresh = [find for find in finds if find not in reused]
+    ranks = dict()
+    if reused:
+        stale_ranks = TokenStore.from_series(df[col][stale], sep).rank_many(reused)
+        for pos, find in enumerate(reused):
+            name = food_parser.index_column(find)
+            values = np.empty(len(df), dtype=np.int64)
+            values[~stale] = prev_df[name].to_numpy()[kept]
+            values[stale] = stale_ranks[:, pos]
+            ranks[name] = values
+    if fresh:
+        fresh_ranks = bfood.tokens(col, sep).rank_many(fresh, df.index)
+        for pos, find in enumerate(fresh):
+            ranks[food_parser.index_column(find)] = fresh_ranks[:, pos]
+    bfood.run_on_df(_insert_columns, ranks)
+
+    counts = previous._known_ingredient_counts()
+    if counts is not None and col == "ingredients":
+        gone = np.ones(len(prev_df), dtype=bool)
+        gone[kept] = False
+        removed = food_parser.split_ingredients(prev_df[col][gone]).value_counts()
+        added = food_parser.split_ingredients(df[col][stale]).value_counts()
+        counts = counts.add(added, fill_value=0).sub(removed, fill_value=0)
+        bfood._seed_ingredient_counts(counts[counts > 0].astype("int64")
+                                      .sort_values(ascending=False, kind="mergesort"))
+    return bfood
+
+
+def _unique_keys(keys: np.ndarray) -> np.ndarray:
+    """Selects the last row of each non-missing key.
+
+    Returns:
+        np.ndarray: The positions of the selected rows.
+    """
+    keys = pd.Index(keys)
+    return np.flatnonzero(~keys.duplicated(keep="last") & ~keys.isna())
+
+
+def rank_changes(previous: food_parser.BaseFood,
+                 current: food_parser.BaseFood,
+                 finds: Iterable[str],
+                 col: str = "ingredients",
+                 sep: str = ",",
+                 key: str = "gtin_upc") -> pd.DataFrame:
+    """Establishes how the rank of terms moved between two releases of the same products.
+
+    The releases are hash joined on `key`; a product listed several times in
+    a release is represented by its last row, and rows missing the key are
+    left out.  The cached hashes of the `col` column (see
+    `BaseFood.row_hashes`) then select the products whose text changed, and
+    only those are tokenized and ranked, as done by `insert_indices`.
+
+    Args:
+        previous (BaseFood): The earlier release, e.g. a FoodBrandObject.
+        current (BaseFood): The later release.
+        finds (Iterable[str]): The strings to compare the ranks of.
+        col (str): The name of the column to rank the strings in.
+        sep (str): The delimiter to split the column's values against.
+        key (str): The column identifying a product across releases.
+    Returns:
+        pd.DataFrame: One row per product and term whose rank changed, with
+        the product's `key`, its fdc_id in each release, the term, its
+        previous and current rank (-1 where it is not listed) and the
+        `delta` from one to the other.  A negative delta means the term moved
+        up the list; the delta is missing where the term was added or removed.
+    """
+    finds = list(finds)
+    prev_pos = _unique_keys(previous._values(key).to_numpy())
+    cur_pos = _unique_keys(current._values(key).to_numpy())
+    cur_keys = current._values(key).to_numpy()[cur_pos]
+    found = pd.Index(previous._values(key).to_numpy()[prev_pos]).get_indexer(cur_keys)
+    both = found >= 0
+    prev_pos, cur_pos, cur_keys = prev_pos[found[both]], cur_pos[both], cur_keys[both]
+    changed = previous.row_hashes(col)[prev_pos] != current.row_hashes(col)[cur_pos]
+    prev_pos, cur_pos, cur_keys = prev_pos[changed], cur_pos[changed], cur_keys[changed]
+
+    before = TokenStore.from_series(previous._values(col).iloc[prev_pos], sep).rank_many(finds)
+    after = TokenStore.from_series(current._values(col).iloc[cur_pos], sep).rank_many(finds)
+    rows, terms = np.nonzero(before != after)
+    moved = (before[rows, terms] > 0) & (after[rows, terms] > 0)
+    delta = pd.array(after[rows, terms] - before[rows, terms], dtype="Int64")
+    delta[~moved] = pd.NA
+    return pd.DataFrame({
+        key: cur_keys[rows],
+        "previous_fdc_id": previous._values("fdc_id").to_numpy()[prev_pos[rows]],
+        "fdc_id": current._values("fdc_id").to_numpy()[cur_pos[rows]],
+        "term": np.asarray(finds, dtype=object)[terms],
+        "previous": before[rows, terms],
+        "current": after[rows, terms],
+        "delta": delta,
+    })
+
+
+def _insert_columns(df: pd.DataFrame, values: dict) -> pd.DataFrame:
+    for name, column in values.items():
+        df[name] = column
+    return df
+
+
+# The file name of each table of a release.
+TABLES = {
+    "food": "food.csv",
+    "branded_food": "branded_food.csv",
+    "nutrient": "nutrient.csv",
+    "food_nutrient": "food_nutrient.csv",
+}
+
+# The food object class of each table loaded as one.
+_FOOD_CLASSES = {
+    "food": food_parser.FoodObject,
+    "branded_food": food_parser.FoodBrandObject,
+}
+
+
+class Catalog:
+    def __init__(self, location: str) -> None:
+        """The tables of a single FoodData Central release.
+
+        No table is read until it is first used.  The food tables are loaded
+        with only their fdc_id column, which keys every join; their other
+        columns load when accessed.
+
+        Args:
+            location (str): The release's extracted directory or zip archive.
+        """
+        self._location = os.fspath(location)
+        self._members = None
+        if os.path.isfile(self._location):
+            with zipfile.ZipFile(self._location, "r") as zf:
+                self._members = zf.namelist()
+        self._tables = dict()
+        self._joins = dict()
+
+    @property
+    def name(self) -> str:
+        """Provides the release's name, e.g. FoodData_Central_csv_2020-10-30.
+        """
+        return os.path.splitext(os.path.basename(self._location.rstrip(os.sep)))[0]
+
+    def path(self, table: str) -> Optional[str]:
+        """Provides the path of one of the release's tables.
+
+        Args:
+            table (str): The table's name, a key of TABLES.
+        Returns:
+            str: The CSV file path, or `archive.zip::member.csv` path, of the
+            table, or None if the release does not include it.
+        """
+        filename = TABLES[table]
+        if self._members is None:
+            path = os.path.join(self._location, filename)
+            return path if os.path.exists(path) else None
+        names = [name for name in self._members if name.rsplit("/", 1)[-1] == filename]
+        return archive.join_path(self._location, names[0]) if len(names) == 1 else None
+
+    @property
+    def tables(self) -> List[str]:
+        """Provides the names of the tables included in the release.
+        """
+        return [table for table in TABLES if self.path(table) is not None]
+
+    def table(self, table: str):
+        """Provides one of the release's tables, loading it on first use.
+
+        The same object is returned to every caller, so it must not be
+        filtered in place; use e.g. `branch()` on a food object first.
+
+        Args:
+            table (str): The table's name, a key of TABLES.
+        Returns:
+            The FoodObject, FoodBrandObject, NutrientLookup or NutrientMatrix
+            of the table.
+        Raises:
+            KeyError: If the release does not include the table.
+        """
+        if table not in self._tables:
+            path = self.path(table)
+            if path is None:
+                raise KeyError("{} has no {} table".format(self.name, table))
+            if table in _FOOD_CLASSES:
+                self._tables[table] = _FOOD_CLASSES[table](path, columns=["fdc_id"])
+            elif table == "nutrient":
+                self._tables[table] = NutrientLookup(path)
+            else:
+                self._tables[table] = NutrientMatrix.from_csv(path, self.nutrients)
+        return self._tables[table]
+
+    @property
+    def food(self) -> food_parser.FoodObject:
+        return self.table("food")
+
+    @property
+    def branded_food(self) -> food_parser.FoodBrandObject:
+        return self.table("branded_food")
+
+    @property
+    def nutrients(self) -> NutrientLookup:
+        return self.table("nutrient")
+
+    @property
+    def food_nutrient(self) -> NutrientMatrix:
+        return self.table("food_nutrient")
+
+    def _keys(self, table: str) -> np.ndarray:
+        # Joins are made over all the rows of a food table, whatever its filters.
+        base, _ = self.table(table)._selection()
+        return base["fdc_id"].to_numpy()
+
+    def positions(self, left: str, right: str) -> np.ndarray:
+        """Joins two food tables on fdc_id.
+
+        The join is computed once per catalog and reused by later calls.
+
+        Args:
+            left (str): The name of the table whose rows are matched.
+            right (str): The name of the table to match them against.
+        Returns:
+            np.ndarray: For each row of `left`, the position of the row of
+            `right` with the same fdc_id, or -1 if there is none.
+        """
+        key = (left, right)
+        if key not in self._joins:
+            self._joins[key] = pd.Index(self._keys(right)).get_indexer(self._keys(left))
+        return self._joins[key]
+
+    def join(self, left: str, right: str, columns: List[str]) -> pd.DataFrame:
+        """Adds columns of one food table to the rows of another.
+
+        Args:
+            left (str): The name of the table whose rows are kept.
+            right (str): The name of the table to take the columns from.
+            columns (list(str)): The columns of `right` to add.
+        Returns:
+            pd.DataFrame: The fdc_id of every row of `left` and the matching
+            values of `columns`, which are missing where `right` has no match.
+        """
+        pos = self.positions(left, right)
+        right_obj = self.table(right)
+        right_obj._require(columns)
+        base, _ = right_obj._selection()
+        found = pos >= 0
+        ret = pd.DataFrame({"fdc_id": self._keys(left)}, index=self.table(left)._selection()[0].index)
+        for col in columns:
+            values = base[col].take(np.where(found, pos, 0)).reset_index(drop=True)
+            ret[col] = values.where(found).to_numpy()
+        return ret
+
+    def find_by_group(self, grp: str, col: str = "food_category_id") -> pd.DataFrame:
+        """Finds the branded foods whose food record is in the passed group.
+
+        This joins branded_food with food, as `FoodObject.find_by_group` only
+        sees the food table.
+
+        Args:
+            grp (str): The group name to look up.
+            col (str): The column of the food table holding the group.
+        Returns:
+            pd.DataFrame: The matching rows of the branded food table.
+        """
+        groups = self.join("branded_food", "food", [col])[col]
+        base, _ = self.branded_food._selection()
+        return base[(groups == grp).to_numpy()]
+
+    def branded_nutrients(self) -> sp.csr_matrix:
+        """Joins branded_food with food_nutrient.
+
+        Returns:
+            sp.csr_matrix: The normalized nutrient amounts of each row of the
+            branded food table, in its row order; see `NutrientMatrix`.
+        """
+        key = ("branded_food", "food_nutrient")
+        if key not in self._joins:
+            self._joins[key] = self.food_nutrient.rows(self._keys("branded_food"))
+        return self._joins[key]
+
+
+def releases(csv_dir: str = "dataset") -> List[Catalog]:
+    """Establishes a catalog for each release in a directory.
+
+    A release is either an extracted directory or a zip archive.  An archive
+    is skipped when its release has also been extracted, as are hidden
+    entries such as the fetcher's partial downloads.
+
+    Args:
+        csv_dir (str): The directory holding the releases.
+    Returns:
+        list(Catalog): The catalog of each release, ordered by name.
+    """
+    entries = os.listdir(csv_dir)
+    ret = list()
+    for entry in sorted(entries):
+        if entry.startswith("."):
+            continue
+        stem, ext = os.path.splitext(entry)
+        path = os.path.join(csv_dir, entry)
+        if ext == ".zip" and stem not in entries or os.path.isdir(path):
+            ret.append(Catalog(path))
+    return ret
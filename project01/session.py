@@ -0,0 +1,97 @@
+"""
+This module provides a shared analysis session for our question drivers.
+
+Each question needs the same cleaned branded food table with a ranked
+index column per ingredient of interest.  Rather than every driver loading,
+cleaning and ranking the CSV file on its own, an `AnalysisSession` does so
+once and hands out views of the result.
+
+The `run_all()` function produces the output of every question from a single
+session, and can be run directly using python3 -m project01.session after the
+files have been fetched from the USDA (see `project01.fetcher`).
+"""
+
+import sys
+from typing import Iterable, List, Optional
+
+import pandas as pd
+
+import project01.parser as food_parser
+
+# The ingredients ranked by the question drivers.
+TERMS = ("corn syrup", "high fructose corn syrup", "sugar")
+
+
+class AnalysisSession:
+    def __init__(self,
+                 csv_file: str,
+                 terms: Iterable[str] = TERMS,
+                 columns: Optional[List[str]] = food_parser.ANALYSIS_COLUMNS) -> None:
+        """Loads, cleans and ranks the branded food table once.
+
+        Args:
+            csv_file (str): The path to the branded_foods.csv file.
+            terms (Iterable[str]): The ingredients to insert a ranked index column for.
+            columns (list(str)): The columns to load up front.  Defaults to the
+                columns used by the question drivers.
+        """
+        self._terms = list(terms)
+        self._bfood = food_parser.FoodBrandObject(csv_file, columns=columns)
+        self._bfood.cleanup()
+        self._bfood.run_on_df(food_parser.insert_indices, self._terms, store=self._bfood.tokens())
+
+    @property
+    def terms(self) -> List[str]:
+        """Provides the ingredients ranked by the session.
+        """
+        return list(self._terms)
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """Provides the session's cleaned and ranked dataframe.
+
+        The dataframe is shared by every user of the session and must be
+        treated as read-only.
+        """
+        return self._bfood.df
+
+    def food(self) -> food_parser.FoodBrandObject:
+        """Establishes a food object over the session's dataframe.
+
+        The object is a branch of the session's object, sharing its data
+        without copying it.  Filtering it, e.g. with `clamp` or `find_top`,
+        leaves the session untouched, but values must not be modified in place.
+
+        Returns:
+            food_parser.FoodBrandObject: A new food object for one analysis.
+        """
+        return self._bfood.branch()
+
+
+def run_all(csv_file: str):
+    """Pythonic driver for every question / query
+
+    The branded food table is loaded, cleaned and ranked a single time and
+    shared by each question.
+
+    Args:
+        csv_file (str): The path to the branded_foods.csv file.
+
+    Returns:
+        None: Output to the terminal statistics and various
+        plots are written out to file.
+    """
+    # The question drivers depend on this module, so defer their import.
+    import project01.question1 as question1
+    import project01.question2 as question2
+    import project01.question3 as question3
+    import project01.question4 as question4
+
+    session = AnalysisSession(csv_file)
+    for question in (question1, question2, question3, question4):
+        question.run(session)
+
+
+if __name__ == "__main__":
+    brand_csv = sys.argv[1] if len(sys.argv) > 2 else "./dataset/FoodData_Central_csv_2020-10-30/branded_food.csv"
+    run_all(csv_file=brand_csv)
@@ -1,5 +1,9 @@
+import functools
+import hashlib
+import http.server
 import os
 import shutil
+import threading
 
 import pytest
 
@@ -36,3 +40,67 @@ def copytree(src, dst, symlinks=False, ignore=None):
             shutil.copytree(s, d, symlinks, ignore)
         else:
             shutil.copy2(s, d)
+
+
+@pytest.fixture
+def server(tmpdir):
+    """Serves the files of a directory over HTTP on localhost."""
+    served = tmpdir.mkdir("served")
+    RangeHandler.requests = []
+    RangeHandler.drop_after = None
+    handler = functools.partial(RangeHandler, directory=str(served))
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield served, "http://127.0.0.1:{}".format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """A stand-in for the USDA server, supporting ETags and byte ranges.
+
+    Setting `drop_after` closes the next response's connection after that
+    many bytes of its body have been sent.
+    """
+    requests = []
+    drop_after = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as fin:
+            body = fin.read()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        RangeHandler.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start = 0
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range", etag) == etag:
+            start = int(byte_range.split("=")[1].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(len(body)))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(body) - 1, len(body)))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        drop_after, RangeHandler.drop_after = RangeHandler.drop_after, None
+        self.wfile.write(body[start:start + drop_after] if drop_after is not None else body[start:])
+        if drop_after is not None:
+            self.close_connection = True
@@ -0,0 +1,54 @@
+import os
+import zipfile
+
+import pytest
+
+import project01.archive as archive
+import project01.parser as parser
+
+
+def make_archive(datadir, name="release.zip", prefix="FoodData_Central_csv_2020-10-30/"):
+    path = datadir.join(name)
+    with zipfile.ZipFile(str(path), "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(str(datadir.join("branded_food.csv")), prefix + "branded_food.csv")
+        zf.writestr(prefix + "food.csv", "fdc_id,data_type,description\n1,branded_food,Candy\n")
+    return path
+
+
+def test_split_path():
+    assert archive.split_path("dir/release.zip::food.csv") == ("dir/release.zip", "food.csv")
+    assert archive.split_path("dir/food.csv") == ("dir/food.csv", None)
+
+
+def test_read_member(datadir):
+    path = make_archive(datadir)
+    expected = parser.FoodBrandObject(datadir.join("branded_food.csv"), cache=False).df
+    bfood = parser.FoodBrandObject(archive.join_path(path, "branded_food.csv"))
+    assert bfood.df.equals(expected)
+    # Only the cache is written next to the archive; nothing is extracted.
+    assert sorted(os.listdir(str(datadir))) == [".cache", "branded_food.csv", "release.zip"]
+    cached = parser.FoodBrandObject(archive.join_path(path, "FoodData_Central_csv_2020-10-30/branded_food.csv"))
+    assert cached.df["ingredients"].tolist() == expected["ingredients"].tolist()
+
+
+def test_stream_member(datadir):
+    path = make_archive(datadir)
+    chunks = list(parser.FoodBrandObject.stream(archive.join_path(path, "branded_food.csv"),
+                                                chunksize=3, cleanup=False))
+    assert [len(chunk.df) for chunk in chunks] == [3, 3, 2]
+
+
+def test_missing_member(datadir):
+    path = make_archive(datadir)
+    with pytest.raises(KeyError):
+        parser.FoodBrandObject(archive.join_path(path, "nutrient.csv"))
+
+
+def test_load_archives(datadir):
+    releases = datadir.mkdir("dataset")
+    make_archive(datadir, "dataset/FoodData_Central_csv_2020-04-29.zip")
+    make_archive(datadir, "dataset/FoodData_Central_csv_2020-10-30.zip")
+    # An extracted release is read from its directory instead.
+    releases.mkdir("FoodData_Central_csv_2020-10-30").join("food.csv").write("fdc_id,description\n2,Soda\n")
+    foods = sorted(parser.load(str(releases)), key=lambda food: food.df["fdc_id"].iloc[0])
+    assert [food.df["description"].tolist() for food in foods] == [["Candy"], ["Soda"]]
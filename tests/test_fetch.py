@@ -1,8 +1,15 @@
 
+import hashlib
+import json
+import os
+import zipfile
+
 import pytest
 
 import project01.fetch as fetch
+import project01.release as release
 import tempfile
+from tests.conftest import RangeHandler
 
 
 @pytest.fixture
@@ -11,6 +18,19 @@ def tempfile_setup():
         yield tf
 
 
+def make_archive(path, members):
+    with zipfile.ZipFile(str(path), "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, text in members.items():
+            zf.writestr(name, text)
+    return hashlib.sha256(path.read_binary()).hexdigest()
+
+
+def single_fetcher(tmpdir, uri, checksum="", **kwargs):
+    uri_file = tmpdir.join("uri.txt")
+    uri_file.write("{} {}\n".format(uri, checksum))
+    return fetch.Fetcher(uris=str(uri_file), base=str(tmpdir.join("dataset")), feedback=False, **kwargs)
+
+
 def test_constructor(tempfile_setup):
     fetcher = fetch.Fetcher(uris=tempfile_setup.name, base="testbase", feedback=False)
     assert fetcher._uris == []
@@ -36,6 +56,192 @@ def test_add_uri(tempfile_setup):
     assert fetcher._uris == ["Testlinegood", "next-line"]
 
 
-def test_fetch():
-    # Will need to spy this
-    pass
+def test_parse_checksum(tempfile_setup):
+    tempfile_setup.write("first.zip sha256:ABC123\n")
+    tempfile_setup.write("\n")
+    tempfile_setup.write("second.zip\n")
+    tempfile_setup.flush()
+    fetcher = fetch.Fetcher(uris=tempfile_setup.name)
+    assert fetcher._uris == ["first.zip", "second.zip"]
+    assert fetcher._checksums == {"first.zip": "abc123"}
+
+
+def test_fetch(server, tmpdir, capsys):
+    served, url = server
+    releases = ["FoodData_Central_csv_2020-04-29", "FoodData_Central_csv_2020-10-30"]
+    for release in releases:
+        make_archive(served.join(release + ".zip"), {"food.csv": release * 1000})
+    uri_file = tmpdir.join("uri.txt")
+    uri_file.write("".join("{}/{}.zip\n".format(url, release) for release in releases))
+    out = tmpdir.join("dataset")
+    fetcher = fetch.Fetcher(uris=str(uri_file), base=str(out), workers=2)
+    assert fetcher.fetch() == str(out)
+    lines = capsys.readouterr().out
+    for release in releases:
+        assert out.join(release, "food.csv").read() == release * 1000
+        assert "{}.zip: 100/100".format(release) in lines
+        assert "Extracted {}.zip".format(release) in lines
+
+
+def test_fetch_failure(server, tmpdir):
+    served, url = server
+    make_archive(served.join("good.zip"), {"food.csv": "ok"})
+    uri_file = tmpdir.join("uri.txt")
+    uri_file.write("{0}/missing.zip\n{0}/good.zip\n".format(url))
+    out = tmpdir.join("dataset")
+    with pytest.raises(Exception):
+        fetch.Fetcher(uris=str(uri_file), base=str(out), feedback=False).fetch()
+    # The other downloads still complete.
+    assert os.path.exists(str(out.join("good", "food.csv")))
+
+
+def test_fetch_skips_unchanged(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "first"})
+    fetcher = single_fetcher(tmpdir, url + "/release.zip")
+    fetcher.fetch()
+    fetcher.fetch()
+    assert RangeHandler.requests[-1]["If-None-Match"]
+    assert not os.path.exists(str(tmpdir.join("dataset", fetch.DOWNLOAD_DIR, "release.zip")))
+    make_archive(served.join("release.zip"), {"food.csv": "second"})
+    fetcher.fetch()
+    assert tmpdir.join("dataset", "release", "food.csv").read() == "second"
+
+
+def test_fetch_resumes(server, tmpdir):
+    served, url = server
+    checksum = make_archive(served.join("release.zip"), {"food.csv": os.urandom(50000).hex()})
+    RangeHandler.drop_after = 20000
+    single_fetcher(tmpdir, url + "/release.zip", checksum).fetch()
+    assert len(RangeHandler.requests) == 2
+    assert RangeHandler.requests[1]["Range"] == "bytes=20000-"
+    assert tmpdir.join("dataset", "release", "food.csv").size() == 100000
+
+
+def test_fetch_resumes_on_next_run(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": os.urandom(50000).hex()})
+    RangeHandler.drop_after = 20000
+    with pytest.raises(IOError):
+        single_fetcher(tmpdir, url + "/release.zip", retries=0).fetch()
+    part = tmpdir.join("dataset", fetch.DOWNLOAD_DIR, "release.zip.part")
+    assert part.size() == 20000
+    single_fetcher(tmpdir, url + "/release.zip").fetch()
+    assert RangeHandler.requests[-1]["Range"] == "bytes=20000-"
+    assert not part.exists()
+    assert tmpdir.join("dataset", "release", "food.csv").size() == 100000
+
+
+def test_fetch_verifies_checksum(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "data"})
+    with pytest.raises(ValueError):
+        single_fetcher(tmpdir, url + "/release.zip", "sha256:" + "0" * 64).fetch()
+    assert not tmpdir.join("dataset", "release").exists()
+    assert not tmpdir.join("dataset", fetch.DOWNLOAD_DIR, "release.zip.part").exists()
+
+
+def test_selected():
+    assert fetch.selected("release/food.csv", fetch.PIPELINE_MEMBERS)
+    assert fetch.selected("branded_food.csv", fetch.PIPELINE_MEMBERS)
+    assert not fetch.selected("release/food_attribute.csv", fetch.PIPELINE_MEMBERS)
+    for name in ["foundation_food.csv", "sr_legacy_food.csv", "survey_fndds_food.csv", "sub_sample_food.csv",
+                 "input_food.csv", "release/sample_food.csv", "food_nutrient_source.csv"]:
+        assert not fetch.selected(name, fetch.PIPELINE_MEMBERS)
+    assert fetch.selected("release/food_nutrient.csv", fetch.PIPELINE_MEMBERS)
+    assert fetch.selected("anything.txt", None)
+
+
+def test_extract_members(tmpdir):
+    archive = tmpdir.join("release.zip")
+    make_archive(archive, {"release/food.csv": "food",
+                           "release/branded_food.csv": "branded",
+                           "release/food_attribute.csv": "attribute",
+                           "release/nutrient.csv": "nutrient"})
+    names = fetch.extract(str(archive), str(tmpdir.join("out")), ["*food.csv", "nutrient.csv"], workers=3)
+    assert sorted(names) == ["release/branded_food.csv", "release/food.csv", "release/nutrient.csv"]
+    assert tmpdir.join("out", "release", "branded_food.csv").read() == "branded"
+    assert not tmpdir.join("out", "release", "food_attribute.csv").exists()
+
+
+def test_fetch_members_changed(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "food", "nutrient.csv": "nutrient"})
+    single_fetcher(tmpdir, url + "/release.zip", members=["food.csv"]).fetch()
+    assert not tmpdir.join("dataset", "release", "nutrient.csv").exists()
+    requests = len(RangeHandler.requests)
+    single_fetcher(tmpdir, url + "/release.zip", members=["nutrient.csv"]).fetch()
+    # A different allow-list is extracted from the kept archive, without a request.
+    assert len(RangeHandler.requests) == requests
+    assert tmpdir.join("dataset", "release", "nutrient.csv").read() == "nutrient"
+
+
+def test_fetch_members_changed_corrupt_archive(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "food", "nutrient.csv": "nutrient"})
+    single_fetcher(tmpdir, url + "/release.zip", members=["food.csv"]).fetch()
+    kept = tmpdir.join("dataset", "release.zip")
+    kept.write_binary(b"x" * kept.size())
+    requests = len(RangeHandler.requests)
+    single_fetcher(tmpdir, url + "/release.zip", members=["nutrient.csv"]).fetch()
+    # An archive which no longer matches its checksum is downloaded again.
+    assert len(RangeHandler.requests) == requests + 1
+    assert tmpdir.join("dataset", "release", "nutrient.csv").read() == "nutrient"
+
+
+def test_fetch_keeps_archive(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "food", "nutrient.csv": "nutrient"})
+    single_fetcher(tmpdir, url + "/release.zip").fetch()
+    kept = tmpdir.join("dataset", "release.zip")
+    with zipfile.ZipFile(str(kept)) as zf:
+        assert zf.read("food.csv") == b"food"
+    assert tmpdir.join("dataset", "release", "food.csv").read() == "food"
+
+
+def test_fetch_without_extracting(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "food"})
+    single_fetcher(tmpdir, url + "/release.zip", extract=False).fetch()
+    assert tmpdir.join("dataset", "release.zip").exists()
+    assert not tmpdir.join("dataset", "release").exists()
+    catalogs = release.releases(str(tmpdir.join("dataset")))
+    assert [catalog.path("food") for catalog in catalogs] == [str(tmpdir.join("dataset", "release.zip")) + "::food.csv"]
+    single_fetcher(tmpdir, url + "/release.zip", extract=False).fetch()
+    assert RangeHandler.requests[-1]["If-None-Match"]
+    # Extracting later reads the kept archive, without a request.
+    requests = len(RangeHandler.requests)
+    single_fetcher(tmpdir, url + "/release.zip").fetch()
+    assert len(RangeHandler.requests) == requests
+    assert tmpdir.join("dataset", "release", "food.csv").read() == "food"
+
+
+def stale_part(tmpdir, served, url, data):
+    """Leaves a partial download of release.zip, as an interrupted fetch would."""
+    body = served.join("release.zip").read_binary()
+    downloads = tmpdir.join("dataset", fetch.DOWNLOAD_DIR)
+    downloads.ensure(dir=True)
+    downloads.join("release.zip.part").write_binary(data)
+    meta = {"uri": url + "/release.zip", "etag": '"{}"'.format(hashlib.md5(body).hexdigest()), "complete": False}
+    downloads.join("release.zip.json").write(json.dumps(meta))
+    return downloads.join("release.zip.part")
+
+
+def test_fetch_keeps_complete_part(server, tmpdir):
+    served, url = server
+    checksum = make_archive(served.join("release.zip"), {"food.csv": "food"})
+    part = stale_part(tmpdir, served, url, served.join("release.zip").read_binary())
+    single_fetcher(tmpdir, url + "/release.zip", checksum).fetch()
+    assert len(RangeHandler.requests) == 1
+    assert not part.exists()
+    assert tmpdir.join("dataset", "release", "food.csv").read() == "food"
+
+
+def test_fetch_restarts_oversized_part(server, tmpdir):
+    served, url = server
+    make_archive(served.join("release.zip"), {"food.csv": "food"})
+    stale_part(tmpdir, served, url, served.join("release.zip").read_binary() + b"junk")
+    single_fetcher(tmpdir, url + "/release.zip").fetch()
+    assert len(RangeHandler.requests) == 2
+    assert "Range" not in RangeHandler.requests[1]
+    assert tmpdir.join("dataset", "release", "food.csv").read() == "food"
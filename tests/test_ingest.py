@@ -0,0 +1,53 @@
+import zipfile
+
+import pytest
+import requests
+
+import project01.archive as archive
+import project01.ingest as ingest
+import project01.parser as parser
+from project01.cache import ColumnCache
+from project01.fetch import DOWNLOAD_DIR
+
+
+def serve_release(datadir, served, name="release.zip"):
+    with zipfile.ZipFile(str(served.join(name)), "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("release/food_attribute.csv", "id,value\n1,unused\n")
+        zf.write(str(datadir.join("branded_food.csv")), "release/branded_food.csv")
+        zf.writestr("release/food.csv", "fdc_id,data_type,description,publication_date\n"
+                                        "1,branded_food,Candy,2020-10-30\n")
+
+
+def test_ingest(datadir, server):
+    served, url = server
+    serve_release(datadir, served)
+    out = datadir.join("dataset")
+    tables = ingest.ingest(url + "/release.zip", out=str(out), chunksize=3, queue_size=2, feedback=False)
+    branded = archive.join_path(str(out.join("release.zip")), "release/branded_food.csv")
+    food = archive.join_path(str(out.join("release.zip")), "release/food.csv")
+    assert sorted(tables) == sorted([branded, food])
+    assert ColumnCache(branded, "branded_food", parser.SCHEMAS["branded_food"]).is_valid()
+    expected = parser.FoodBrandObject(datadir.join("branded_food.csv"), cache=False).df
+    assert tables[branded].df.equals(expected)
+    assert tables[food].df["publication_date"].dt.year.tolist() == [2020]
+    # Nothing is extracted; the archive is kept for later loads.
+    assert sorted(out.listdir(lambda p: not p.basename.startswith("."))) == [out.join("release.zip")]
+
+
+def test_ingest_failure(datadir, server):
+    served, url = server
+    with pytest.raises(requests.HTTPError):
+        ingest.ingest(url + "/missing.zip", out=str(datadir.join("dataset")), feedback=False)
+    assert datadir.join("dataset", DOWNLOAD_DIR).listdir() == []
+
+
+def test_ingest_leaves_fetch_part(datadir, server):
+    served, url = server
+    serve_release(datadir, served)
+    out = datadir.join("dataset")
+    part = out.join(DOWNLOAD_DIR, "release.zip.part")
+    part.write_binary(b"partial fetch", ensure=True)
+    ingest.ingest(url + "/release.zip", out=str(out), feedback=False)
+    # A fetch of the same archive can still resume its own download.
+    assert part.read_binary() == b"partial fetch"
+    assert out.join(DOWNLOAD_DIR).listdir() == [part]
@@ -0,0 +1,156 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import project01.ingredients as ingredients
+import project01.parser as parser
+from project01.cache import ColumnCache
+from project01.ingredients import InvertedIndex, Matcher, TokenStore
+
+
+SAMPLE = pd.Series(["Water, Corn Syrup, High Fructose Corn Syrup, Salt",
+                    "sugar, salt",
+                    np.nan,
+                    "Tomatoes"],
+                   index=[4, 7, 9, 12])
+
+
+def test_token_store_layout():
+    store = TokenStore.from_series(SAMPLE)
+    assert len(store) == 4
+    assert list(store.offsets) == [0, 4, 6, 7, 8]
+    assert store.row_tokens(0) == ("water", "corn syrup", "high fructose corn syrup", "salt")
+    assert store.row_tokens(2) == ("nan",)
+    assert list(store.labels) == [4, 7, 9, 12]
+
+
+def test_token_store_rank_matches_find_index_from_str():
+    store = TokenStore.from_series(SAMPLE)
+    for find in ["corn syrup", "SALT", "tomato", "nan", "absent"]:
+        assert store.rank(find).tolist() == [parser.find_index_from_str(x, find) for x in SAMPLE]
+
+
+def test_token_store_positions_and_labels():
+    store = TokenStore.from_series(SAMPLE)
+    rows, ranks = store.positions("corn syrup")
+    assert rows.tolist() == [0, 0]
+    assert ranks.tolist() == [2, 3]
+    assert store.rank("salt", labels=[12, 7]).tolist() == [-1, 2]
+    assert store.contains("sugar").tolist() == [False, True, False, False]
+
+
+def test_token_store_save_load(tmpdir):
+    store = TokenStore.from_series(SAMPLE)
+    path = str(tmpdir.join("tokens.npz"))
+    store.save(path)
+    loaded = TokenStore.load(path)
+    assert loaded.row_tokens(0) == store.row_tokens(0)
+    assert loaded.rank("salt").tolist() == store.rank("salt").tolist()
+    assert list(loaded.labels) == [4, 7, 9, 12]
+
+
+def test_food_tokens_persisted(datadir):
+    csv_file = datadir.join("branded_food.csv")
+    fb_object = parser.FoodBrandObject(csv_file, columns=["fdc_id"])
+    store = fb_object.tokens()
+    cache_dir = ColumnCache(csv_file, "branded_food", parser.SCHEMAS["branded_food"]).path
+    assert any(name.startswith("tokens.ingredients") for name in os.listdir(cache_dir))
+    fb_object.run_on_df(parser.insert_indices, ["salt"], store=fb_object.tokens())
+    assert fb_object.df["salt_idx"].tolist() == [3, 3, -1, 15]
+    assert store.rank("salt").tolist() == [3, 3, -1, 15]
+
+
+def test_matcher_search():
+    matcher = Matcher(["corn syrup", "Syrup", "fructose", "he", "she", "hers"])
+    assert matcher.search("High Fructose Corn Syrup") == {0, 1, 2}
+    assert matcher.search("ushers") == {3, 4, 5}
+    assert matcher.search("water") == set()
+    assert Matcher([""]).search("") == {0}
+
+
+def test_matcher_first_ranks_matches_find_index_from_str():
+    terms = ["corn syrup", "salt", "sugar", "nan", "absent", "s"]
+    matcher = Matcher(terms)
+    for value in SAMPLE:
+        assert matcher.first_ranks(value) == [parser.find_index_from_str(value, term) for term in terms]
+
+
+def test_token_store_rank_many():
+    store = TokenStore.from_series(SAMPLE)
+    terms = ["corn syrup", "Salt", "sugar", "nan", "absent", "s", "high fructose corn syrup"]
+    ranks = store.rank_many(terms)
+    assert ranks.shape == (4, len(terms))
+    for pos, term in enumerate(terms):
+        assert ranks[:, pos].tolist() == store.rank(term).tolist()
+    assert store.rank_many(terms, labels=[7])[0].tolist() == store.rank_many(terms)[1].tolist()
+
+
+def test_token_store_rank_many_matcher(monkeypatch):
+    store = TokenStore.from_series(SAMPLE)
+    terms = ["corn syrup", "Salt", "sugar", "nan", "absent", "s", "high fructose corn syrup"]
+    scanned = store.rank_many(terms)
+    monkeypatch.setattr(ingredients, "_SCAN_TERMS", 0)
+    assert store.rank_many(terms).tolist() == scanned.tolist()
+    assert store.rank_many([]).shape == (4, 0)
+
+
+def test_split_ingredients_matches_get_all_ingredients(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    split = parser.split_ingredients(fb_object.df["ingredients"])
+    assert set(split) == set(fb_object.get_all_ingredients())
+    assert list(split.loc[2]) == ["white turkey", "natural flavoring"]
+
+
+def test_inverted_index_queries():
+    index = InvertedIndex.from_series(parser.split_ingredients(pd.Series(
+        ["Sugar, Corn Syrup, Salt", "Corn Syrup, Water, Sugar", "Water", "Salt; Sugar, Corn syrup"],
+        index=[10, 11, 12, 13])))
+    assert "corn syrup" in index
+    labels, positions = index.postings("Sugar")
+    assert labels.tolist() == [10, 11, 13]
+    assert positions.tolist() == [1, 3, 2]
+    assert index.frequency("water") == 2
+    assert index.rows("absent").tolist() == []
+    assert index.rank_range("corn syrup", 1, 2).tolist() == [10, 11]
+    assert index.all_of("sugar", "corn syrup", "salt").tolist() == [10, 13]
+    assert index.before("sugar", "corn syrup").tolist() == [10, 13]
+    assert index.before("corn syrup", "sugar").tolist() == [11]
+
+
+def test_food_inverted_index(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    index = fb_object.inverted_index()
+    assert index.rows("salt").tolist() == [3]
+    assert index.rows("less than 2% of salt").tolist() == [0, 1]
+    assert index.rank_range("corn syrup", ceiling=5).tolist() == [3]
+
+
+def test_split_ingredients_matches_clean_ingredients():
+    values = pd.Series(["Flour (Wheat, Niacin), Sugar; Salt. Less Than 2%: Corn Syrup*",
+                        np.nan,
+                        "Milk [Vitamin A], \"Cocoa\" & Spices!, ,Oil{s}",
+                        "Water ( unclosed, Salt"])
+    split = parser.split_ingredients(values)
+    for label, value in values.items():
+        assert tuple(split.loc[[label]]) == parser.clean_ingredients(value)
+
+
+def test_ingredient_frequencies(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    counts = fb_object.ingredient_frequencies()
+    assert set(counts.index) == set(fb_object.get_all_ingredients())
+    assert counts["tomatoes"] == 2
+    assert counts["white turkey"] == 1
+
+
+def test_ingredient_frequencies_follow_filters(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    whole = fb_object.ingredient_frequencies()
+    fb_object.run_on_df(parser.insert_index, "tomatoes")
+    fb_object.clamp(1, col="tomatoes_idx")
+    expected = parser.split_ingredients(fb_object.df["ingredients"]).value_counts()
+    assert fb_object.ingredient_frequencies().to_dict() == expected.to_dict()
+    assert fb_object.branch().ingredient_frequencies().to_dict() == expected.to_dict()
+    fb_object.reset()
+    assert fb_object.ingredient_frequencies().to_dict() == whole.to_dict()
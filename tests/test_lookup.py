@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from project01.lookup import NutrientLookup, NutrientMatrix
+
+
+def test_lookup_single(datadir):
+    lookup = NutrientLookup(datadir.join("nutrient.csv"))
+    assert lookup.lookup_id(1003) == [[1003, "Protein", "G", 203, 600]]
+    assert [row[0] for row in lookup.lookup_name("Energy")] == [1008, 1062]
+    assert lookup.lookup_nutrient_nbr(301)[0][1] == "Calcium, Ca"
+    assert lookup.lookup_rank(1) == []
+
+
+def test_lookup_batch(datadir):
+    lookup = NutrientLookup(datadir.join("nutrient.csv"))
+    assert lookup.lookup_ids([2000, 42, 1003])["name"].tolist() == ["Sugars, total including NLEA", "Protein"]
+    assert lookup.lookup_names(["Protein", "Energy"])["id"].tolist() == [1003, 1008, 1062]
+    assert lookup.lookup_ranks([300, 8700])["id"].tolist() == [1008, 1114]
+
+
+def test_normalize():
+    values = NutrientLookup.normalize(["G", "MG", "UG", "KCAL"], [2, 500, 40, 100])
+    np.testing.assert_allclose(values, [2, 0.5, 0.00004, 100])
+    assert NutrientLookup._normalize("MG", 500) == 0.5
+
+
+def test_normalize_amounts(datadir):
+    lookup = NutrientLookup(datadir.join("nutrient.csv"))
+    amounts = lookup.normalize_amounts([1087, 2000, 1008, 9999], [250, 12.5, 90, 1])
+    np.testing.assert_allclose(amounts, [0.25, 12.5, 90, np.nan])
+
+
+def test_nutrient_matrix(datadir):
+    lookup = NutrientLookup(datadir.join("nutrient.csv"))
+    matrix = NutrientMatrix.from_csv(datadir.join("food_nutrient.csv"), lookup, chunksize=2)
+    assert matrix.shape == (3, 6)
+    assert matrix.fdc_ids.tolist() == [167512, 200000, 344604]
+    assert matrix.matrix.dtype == np.float32
+    sugar = matrix.column("Sugars, total including NLEA")
+    assert sugar.to_dict() == {167512: 30.5, 200000: 0, 344604: 2.0}
+    row = matrix.row(344604)
+    assert row["Calcium, Ca"] == np.float32(0.25)
+    rows = matrix.rows([200000, 1, 167512])
+    assert rows.getnnz(axis=1).tolist() == [1, 0, 2]
+    with pytest.raises(ValueError):
+        matrix.column("Energy")
@@ -1,7 +1,11 @@
+import os
 
+import numpy as np
 import pandas as pd
+import pytest
 
 import project01.parser as parser
+from project01.cache import ColumnCache, decode_text, encode_text
 
 
 def test_food_object_inheritance(datadir):
@@ -108,3 +112,258 @@ def test_find_top_specified_limit_and_col(datadir):
     bfood = parser.BaseFood(datadir.join("rating.csv"))
     df_result = bfood.find_top(col="alt_category", limit=3)
     assert len(df_result["alt_category"].unique()) == 3
+
+
+def test_branded_schema_types(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    assert pd.api.types.is_int64_dtype(fb_object.df["fdc_id"])
+    assert pd.api.types.is_categorical_dtype(fb_object.df["brand_owner"])
+    assert pd.api.types.is_float_dtype(fb_object.df["serving_size"])
+    assert pd.api.types.is_datetime64_dtype(fb_object.df["modified_date"])
+    assert fb_object.df["gtin_upc"].iloc[0] == "00072940755050"
+
+
+def test_base_schema_ignores_missing_columns(datadir):
+    bfood = parser.BaseFood(datadir.join("simple.csv"))
+    assert bfood.df["id"].dtype == object
+
+
+def test_find_top_compacts_categories(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    df_result = fb_object.find_top(limit=1, col="brand_owner")
+    assert list(df_result["brand_owner"].cat.categories) == ["Red Gold"]
+
+
+def test_cache_roundtrip(datadir):
+    csv_file = datadir.join("branded_food.csv")
+    cold = parser.FoodBrandObject(csv_file)
+    assert os.path.isdir(ColumnCache(csv_file, "branded_food", parser.SCHEMAS["branded_food"]).path)
+    warm = parser.FoodBrandObject(csv_file)
+    pd.testing.assert_frame_equal(cold.df, warm.df)
+    pd.testing.assert_frame_equal(cold.df, parser.FoodBrandObject(csv_file, cache=False).df)
+
+
+def test_decode_text_from_memmap(tmpdir):
+    values = ["crème brûlée", np.nan, "", "salt"]
+    parts = {}
+    for part, array in encode_text(values).items():
+        np.save(str(tmpdir.join(part + ".npy")), array)
+        parts[part] = np.load(str(tmpdir.join(part + ".npy")), mmap_mode="r")
+    decoded = decode_text(parts["blob"], parts["offsets"], parts["nulls"])
+    assert decoded[0] == "crème brûlée" and decoded[2:].tolist() == ["", "salt"]
+    assert pd.isna(decoded[1])
+
+
+def test_cache_survives_touch(datadir):
+    csv_file = str(datadir.join("simple.csv"))
+    parser.BaseFood(csv_file)
+    store = ColumnCache(csv_file, "base", parser.SCHEMAS["base"])
+    os.utime(csv_file, ns=(0, 0))
+    assert store.is_valid()
+
+
+def test_cache_invalidated_by_change(datadir):
+    csv_file = str(datadir.join("simple.csv"))
+    parser.BaseFood(csv_file)
+    with open(csv_file, "a") as fout:
+        fout.write("\n9,1,row8")
+    bfood = parser.BaseFood(csv_file)
+    assert len(bfood.df) == 7
+
+
+def test_column_projection(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"), columns=["fdc_id", "ingredients"])
+    assert list(fb_object.df.columns) == ["fdc_id", "ingredients"]
+
+
+def test_lazy_column_load(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"), columns=["fdc_id"])
+    fb_object.find_top(limit=1, col="brand_owner")
+    assert list(fb_object.df["gtin_upc"]) == ["00072940755050", "00072940755043"]
+
+
+def test_lazy_column_relabelled(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"), columns=["fdc_id"])
+    df = fb_object.df
+    filtered = df[df["fdc_id"] > df["fdc_id"].min()]
+    assert list(filtered["gtin_upc"]) == list(df["gtin_upc"])[1:]
+    for relabelled in [df.set_index("fdc_id"), filtered.reset_index(drop=True)]:
+        with pytest.raises(KeyError):
+            relabelled["brand_owner"]
+
+
+def test_projected_cleanup(datadir):
+    full = parser.FoodBrandObject(datadir.join("branded_food.csv"), cache=False)
+    full.cleanup()
+    projected = parser.FoodBrandObject(datadir.join("branded_food.csv"), columns=parser.ANALYSIS_COLUMNS)
+    projected.cleanup()
+    pd.testing.assert_frame_equal(projected.df, full.df[projected.df.columns])
+    assert "discontinued_date" not in projected.df
+
+
+def test_stream_chunks_are_bounded(datadir):
+    chunks = list(parser.FoodBrandObject.stream(datadir.join("branded_food.csv"), chunksize=2,
+                                                finds=["salt"], cleanup=False))
+    assert [len(chunk.df) for chunk in chunks] == [2, 2]
+    assert list(chunks[1].df.index) == [2, 3]
+    assert "salt_idx" in chunks[0].df
+
+
+def test_stream_merged_counts(datadir):
+    whole = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    whole.cleanup()
+    chunks = parser.FoodBrandObject.stream(datadir.join("branded_food.csv"), chunksize=1)
+    counts = parser.merge_counts(parser.partial_counts(chunk.df, "brand_owner") for chunk in chunks)
+    expected = whole.df["brand_owner"].value_counts()
+    assert counts.to_dict() == expected.to_dict()
+    assert parser.describe_counts(counts).tolist() == whole.df["brand_owner"].describe().tolist()
+
+
+def test_merged_counts_break_ties_like_value_counts():
+    rng = np.random.default_rng(5)
+    values = pd.Series(["owner{}".format(i) for i in rng.integers(0, 40, 300)], name="brand_owner")
+    for column in [values, values.astype("category")]:
+        df = column.to_frame()
+        chunks = [df.iloc[start:start + 37] for start in range(0, len(df), 37)]
+        counts = parser.merge_counts(parser.partial_counts(chunk, "brand_owner") for chunk in chunks)
+        expected = df["brand_owner"].value_counts()
+        assert counts.index.tolist() == [str(value) for value in expected.index]
+        assert counts.tolist() == expected.tolist()
+
+
+def test_find_by_fdcid(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    assert fb_object.find_by_fdcid(344606)["brand_owner"].tolist() == ["Cargill"]
+    assert fb_object.find_by_fdcid("344606")["brand_owner"].tolist() == ["Cargill"]
+    assert fb_object.find_by_fdcid(1).empty
+
+
+def test_find_by_fdcids(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    ret = fb_object.find_by_fdcids(["344609", 1, 344604])
+    assert ret["fdc_id"].tolist() == [344609, 344604]
+
+
+def test_fdcid_index_follows_run_on_df(datadir):
+    fb_object = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    assert len(fb_object.find_by_fdcid(344604)) == 1
+    fb_object.run_on_df(lambda df: df.drop(index=0, inplace=True) or df)
+    assert fb_object.find_by_fdcid(344604).empty
+    assert fb_object.find_by_fdcid(344605)["fdc_id"].tolist() == [344605]
+
+
+def test_insert_indices_matches_find_index_from_str(datadir):
+    bfood = parser.BaseFood(datadir.join("branded_food.csv"))
+    finds = ["salt", "corn syrup", "Sugar", "oil", "nan", "absent"]
+    bfood.run_on_df(parser.insert_indices, finds)
+    for find in finds:
+        expected = [parser.find_index_from_str(x, find) for x in bfood.df["ingredients"]]
+        assert bfood.df[parser.index_column(find)].tolist() == expected
+
+
+def test_run_on_df_parallel_matches_sequential(datadir):
+    sequential = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    sequential.run_on_df(parser.insert_indices, ["salt", "corn syrup"])
+    parallel = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    ret = parallel.run_on_df_parallel(parser.insert_indices, ["salt", "corn syrup"], processes=2, partitions=3)
+    pd.testing.assert_frame_equal(pd.DataFrame(ret), pd.DataFrame(sequential.df))
+    assert parallel.df is ret
+
+
+def salted_only(df):
+    df = parser.insert_index(df, "salt")
+    df = df[df["salt_idx"] > 0]
+    df.loc[df["fdc_id"] == 344604, "serving_size"] = 0
+    return df.drop(columns=["market_country"])
+
+
+def test_run_on_df_parallel_changes(datadir):
+    sequential = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    sequential.run_on_df(salted_only)
+    parallel = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    parallel.run_on_df_parallel(salted_only, processes=2, partitions=4)
+    pd.testing.assert_frame_equal(pd.DataFrame(parallel.df), pd.DataFrame(sequential.df))
+
+
+def test_run_partition_returns_changes(datadir):
+    bfood = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    parser._init_partition_job((bfood.df, salted_only, (), {}))
+    try:
+        changed, columns = parser._run_partition((0, 2))
+    finally:
+        parser._init_partition_job(None)
+    assert changed.columns.tolist() == ["serving_size", "salt_idx"]
+    assert columns == [col for col in bfood.df.columns if col != "market_country"] + ["salt_idx"]
+
+
+def test_run_on_df_parallel_loads_columns(datadir):
+    def owners(df):
+        df["owner"] = df["brand_owner"].astype(str).str.upper()
+        return df
+
+    bfood = parser.FoodBrandObject(datadir.join("branded_food.csv"), columns=["fdc_id"])
+    bfood.run_on_df_parallel(owners, processes=2)
+    assert bfood.df["owner"].tolist() == bfood.df["brand_owner"].astype(str).str.upper().tolist()
+
+
+def test_run_on_df_parallel_repeated_labels(datadir):
+    df = parser.FoodBrandObject(datadir.join("branded_food.csv")).df
+    doubled = pd.concat([df, df])
+    sequential = parser.FoodBrandObject.from_df(doubled.copy())
+    sequential.run_on_df(salted_only)
+    parallel = parser.FoodBrandObject.from_df(doubled.copy())
+    parallel.run_on_df_parallel(salted_only, processes=2, partitions=3)
+    pd.testing.assert_frame_equal(pd.DataFrame(parallel.df), pd.DataFrame(sequential.df))
+
+
+def test_run_on_df_parallel_single_process(datadir):
+    bfood = parser.BaseFood(datadir.join("branded_food.csv"))
+    bfood.run_on_df_parallel(parser.insert_index, "salt", processes=1)
+    assert bfood.df["salt_idx"].tolist() == [3, 3, -1, 15]
+
+
+def test_clamp_keeps_changes(datadir):
+    bfood = parser.BaseFood(datadir.join("simple.csv"))
+    bfood.df["corn_syrup_idx"] = pd.to_numeric(bfood.df["corn_syrup_idx"])
+    bfood.clamp()
+    bfood.df["flag"] = range(len(bfood.df))
+    flags = dict(zip(bfood.df["tester"], bfood.df["flag"]))
+    bfood.clamp(ceiling=25)
+    assert bfood.df["flag"].tolist() == [flags["row5"]]
+    assert bfood.branch().df["flag"].tolist() == [flags["row5"]]
+    assert "flag" in bfood.query().collect()
+    assert len(bfood.reset()) == 6
+
+
+def test_clamp_after_dropping_rows(datadir):
+    bfood = parser.FoodBrandObject(datadir.join("branded_food.csv"), columns=["fdc_id", "ingredients"])
+    bfood.run_on_df(parser.insert_index, "salt")
+    bfood.clamp(0, col="salt_idx")
+    bfood.df.drop(index=bfood.df.index[:1], inplace=True)
+    bfood.clamp(0, 100, col="salt_idx")
+    assert len(bfood.df) == 2
+    assert bfood.find_top(limit=1, col="brand_owner")["fdc_id"].tolist() == bfood.df["fdc_id"].tolist()
+
+
+def test_clamp_keeps_base(datadir):
+    bfood = parser.BaseFood(datadir.join("simple.csv"))
+    bfood.df["corn_syrup_idx"] = pd.to_numeric(bfood.df["corn_syrup_idx"])
+    bfood.clamp()
+    bfood.clamp(ceiling=25)
+    assert bfood.df["tester"].tolist() == ["row5"]
+    assert len(bfood.reset()) == 6
+    assert len(bfood.df) == 6
+
+
+def test_branch_is_independent(datadir):
+    bfood = parser.BaseFood(datadir.join("rating.csv"))
+    branch = bfood.branch()
+    branch.find_top(limit=1)
+    branch.df["extra"] = 1
+    assert branch.df["branded_food_category"].unique().tolist() == ["category1"]
+    assert len(bfood.df) == 17
+    assert "extra" not in bfood.df
+    other = bfood.branch()
+    other.df["extra"] = 2
+    assert "extra" not in bfood.df
+    assert len(other.find_top(limit=2, col="alt_category")) == 5
@@ -0,0 +1,69 @@
+import project01.parser as parser
+import project01.query as query
+
+
+def eager(csv_file):
+    bfood = parser.FoodBrandObject(csv_file)
+    bfood.run_on_df(parser.insert_indices, ["corn syrup", "sugar"])
+    return bfood
+
+
+def test_query_matches_eager(datadir):
+    csv_file = datadir.join("branded_food.csv")
+    bfood = eager(csv_file)
+    bfood.clamp(0, 4)
+    expected = bfood.find_top(limit=1, col="brand_owner")
+    result = (parser.FoodBrandObject(csv_file).query()
+              .rank("corn syrup").rank("sugar").clamp(0, 4).top("brand_owner", 1).collect())
+    assert result.index.tolist() == expected.index.tolist()
+    assert result["corn_syrup_idx"].tolist() == expected["corn_syrup_idx"].tolist()
+    assert result["sugar_idx"].tolist() == expected["sugar_idx"].tolist()
+    assert result.columns.tolist() == expected.columns.tolist()
+
+
+def test_query_pushes_filters_below_rank(datadir):
+    q = (query.scan(datadir.join("branded_food.csv"))
+         .rank("corn syrup").where("serving_size_unit", "g").clamp(0).top("brand_owner", 1))
+    assert [op.kind for op in q.plan()] == ["where", "rank", "clamp", "top"]
+    result = q.collect()
+    assert result["fdc_id"].tolist() == [1, 2]
+    assert result["corn_syrup_idx"].tolist() == [2, 2]
+
+
+def test_query_does_not_modify_source(datadir):
+    bfood = parser.FoodBrandObject(datadir.join("branded_food.csv"))
+    bfood.query().where("brand_owner", "Fizz").rank("sugar").collect()
+    assert len(bfood.df) == 8
+    assert "sugar_idx" not in bfood.df
+
+
+def test_query_projection(datadir):
+    q = (query.scan(datadir.join("branded_food.csv"), cache=False)
+         .rank("corn syrup").clamp(0).select("fdc_id", "corn_syrup_idx"))
+    assert q.columns() == ["ingredients", "fdc_id"]
+    result = q.collect()
+    assert result.columns.tolist() == ["fdc_id", "corn_syrup_idx"]
+    assert result["fdc_id"].tolist() == [1, 2, 4, 5, 6]
+    assert result["corn_syrup_idx"].tolist() == [2, 2, 4, 1, 2]
+
+
+def test_query_clamps_base_column(datadir):
+    csv_file = datadir.join("branded_food.csv")
+    result = query.scan(csv_file).clamp(35, col="serving_size").collect()
+    assert result["fdc_id"].tolist() == [3, 4, 5, 6, 7, 8]
+    result = query.scan(csv_file).clamp(35, 100, col="serving_size").collect()
+    assert result["fdc_id"].tolist() == [3, 4, 8]
+    bfood = eager(csv_file)
+    expected = bfood.branch().clamp(0, 3, col="sugar_idx")
+    result = bfood.query().clamp(0, 3, col="sugar_idx").collect()
+    assert result.index.tolist() == expected.index.tolist()
+
+
+def test_query_clamps_empty_selection(datadir):
+    csv_file = datadir.join("branded_food.csv")
+    bfood = eager(csv_file)
+    bfood.clamp(1000, col="corn_syrup_idx")
+    expected = bfood.clamp(col="sugar_idx")
+    result = query.scan(csv_file).where("brand_owner", "Nobody").clamp(col="serving_size").collect()
+    assert len(expected) == 0
+    assert len(result) == 0
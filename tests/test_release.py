@@ -0,0 +1,127 @@
+import zipfile
+
+import pandas as pd
+
+import project01.parser as parser
+import project01.release as release
+
+TERMS = ["corn syrup", "sugar"]
+COLUMNS = parser.ANALYSIS_COLUMNS + ["modified_date"]
+
+
+def processed(csv_file, finds=TERMS):
+    bfood = parser.FoodBrandObject(csv_file, columns=COLUMNS)
+    bfood.cleanup()
+    bfood.run_on_df(parser.insert_indices, finds)
+    return bfood
+
+
+def test_diff(datadir):
+    previous = processed(datadir.join("previous.csv")).df
+    current = processed(datadir.join("current.csv")).df
+    delta = release.diff(previous, current)
+    assert delta.added.tolist() == [9]
+    assert delta.changed.tolist() == [2]
+    assert delta.removed.tolist() == [3]
+    assert delta.matches.tolist() == [0, -1, 3, 4, 5, 6, 7, -1]
+
+
+def test_refresh_matches_full_run(datadir):
+    previous = processed(datadir.join("previous.csv"))
+    previous.get_all_ingredients()
+    refreshed = release.refresh(previous, datadir.join("current.csv"), TERMS + ["water"], columns=COLUMNS)
+    expected = processed(datadir.join("current.csv"), TERMS + ["water"])
+    for col in ["fdc_id", "corn_syrup_idx", "sugar_idx", "water_idx"]:
+        assert refreshed.df[col].tolist() == expected.df[col].tolist()
+    expected_counts = expected.ingredient_frequencies()
+    counts = refreshed.ingredient_frequencies()
+    assert counts.sort_index().to_dict() == expected_counts.sort_index().to_dict()
+
+
+def test_rank_changes(datadir):
+    previous = parser.FoodBrandObject(datadir.join("previous.csv"))
+    current = parser.FoodBrandObject(datadir.join("current.csv"))
+    moved = release.rank_changes(previous, current, TERMS + ["water", "cocoa"])
+    assert moved.columns.tolist() == ["gtin_upc", "previous_fdc_id", "fdc_id", "term", "previous", "current", "delta"]
+    assert moved["gtin_upc"].astype(str).tolist() == ["002", "002", "002", "001", "001", "001"]
+    assert moved["fdc_id"].tolist() == [2, 2, 2, 9, 9, 9]
+    assert moved["previous_fdc_id"].tolist() == [2, 2, 2, 1, 1, 1]
+    assert moved["term"].tolist() == ["corn syrup", "sugar", "cocoa", "corn syrup", "sugar", "water"]
+    assert moved["previous"].tolist() == [2, 1, 3, 2, 3, 1]
+    assert moved["current"].tolist() == [4, 2, 1, 1, 2, -1]
+    assert moved["delta"].tolist()[:5] == [2, 1, -2, -1, -1]
+    assert moved["delta"].isna().tolist() == [False] * 5 + [True]
+
+
+def test_row_hashes(datadir):
+    bfood = parser.FoodBrandObject(datadir.join("current.csv"))
+    hashes = bfood.row_hashes()
+    # Identical ingredients hash alike, and the hashes persist in the cache.
+    assert hashes[0] != hashes[1] and hashes[1] != hashes[7]
+    assert (parser.FoodBrandObject(datadir.join("current.csv")).row_hashes() == hashes).all()
+    bfood.run_on_df(parser.insert_indices, ["corn syrup"])
+    bfood.clamp(1)
+    assert bfood.row_hashes().tolist() == hashes[bfood.df.index.to_numpy()].tolist()
+
+
+def test_row_hashes_after_cleanup(datadir):
+    csv_file = datadir.join("unbranded.csv")
+    csv_file.write(datadir.join("current.csv").read().replace('"4","Bakers"', '"4",""'))
+    cleaned = parser.FoodBrandObject(csv_file)
+    cleaned.cleanup()
+    cleaned.row_hashes()
+    fresh = parser.FoodBrandObject(csv_file)
+    assert len(fresh.row_hashes()) == len(fresh.df) == 8
+    # Hashes persisted before cleanup stay on their rows after it.
+    cleaned = parser.FoodBrandObject(csv_file)
+    cleaned.cleanup()
+    expected = pd.util.hash_pandas_object(cleaned.df["ingredients"], index=False).tolist()
+    assert cleaned.row_hashes().tolist() == expected
+    moved = release.rank_changes(parser.FoodBrandObject(datadir.join("previous.csv")), cleaned, TERMS)
+    assert moved["fdc_id"].tolist() == [2, 2, 9, 9]
+    assert moved["delta"].tolist() == [2, 1, -1, -1]
+
+
+def test_catalog_joins(datadir):
+    catalog = release.Catalog(datadir.join("FoodData_Central_csv_2020-10-30"))
+    assert catalog.name == "FoodData_Central_csv_2020-10-30"
+    assert catalog.tables == ["food", "branded_food", "nutrient", "food_nutrient"]
+    assert catalog.find_by_group("Sweets")["fdc_id"].tolist() == [1, 2]
+    joined = catalog.join("branded_food", "food", ["description"])
+    assert joined["description"].tolist()[:3] == ["Candy A", "Candy B", "Bread"]
+    assert joined["description"].isna().tolist() == [False, False, False, True, False, True, True, True]
+    # Joins are computed once.
+    assert catalog.positions("branded_food", "food") is catalog.positions("branded_food", "food")
+    nutrients = catalog.branded_nutrients()
+    sugar = catalog.nutrients.positions([2000])[0]
+    assert nutrients[:, sugar].toarray().ravel().tolist() == [40, 35.5, 0, 0, 10, 0, 0, 0]
+    assert catalog.branded_nutrients() is nutrients
+
+
+def test_releases(datadir):
+    extracted = datadir.join("FoodData_Central_csv_2020-10-30")
+    with zipfile.ZipFile(str(datadir.join("FoodData_Central_csv_2020-04-29.zip")), "w") as zf:
+        zf.write(str(extracted.join("food.csv")), "FoodData_Central_csv_2020-04-29/food.csv")
+    with zipfile.ZipFile(str(datadir.join("FoodData_Central_csv_2020-10-30.zip")), "w") as zf:
+        zf.write(str(extracted.join("food.csv")), "food.csv")
+    catalogs = release.releases(str(datadir))
+    assert [catalog.name for catalog in catalogs] == ["FoodData_Central_csv_2020-04-29",
+                                                      "FoodData_Central_csv_2020-10-30"]
+    assert catalogs[0].tables == ["food"]
+    foods = parser.load(str(datadir))
+    assert [len(food.df) for food in foods] == [5, 5]
+    assert foods[0].df["description"].tolist()[0] == "Candy A"
+
+
+def test_load_parallel(datadir):
+    extracted = datadir.join("FoodData_Central_csv_2020-10-30")
+    with zipfile.ZipFile(str(datadir.join("FoodData_Central_csv_2020-04-29.zip")), "w") as zf:
+        zf.write(str(extracted.join("branded_food.csv")), "branded_food.csv")
+        zf.write(str(extracted.join("food.csv")), "food.csv")
+    frames = parser.load(str(datadir), how="dict", table="branded_food", processes=2)
+    assert sorted(frames) == ["FoodData_Central_csv_2020-04-29", "FoodData_Central_csv_2020-10-30"]
+    assert all(len(frame) == 8 for frame in frames.values())
+    df = parser.load(str(datadir), how="frame", columns=["fdc_id", "data_type"])
+    assert df.columns.tolist() == ["release", "fdc_id", "data_type"]
+    assert df["release"].value_counts().tolist() == [5, 5]
+    assert df["data_type"].dtype == "category"
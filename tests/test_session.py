@@ -0,0 +1,21 @@
+import project01.parser as parser
+import project01.session as session
+
+
+def test_session_ranks_terms(datadir):
+    analysis = session.AnalysisSession(datadir.join("branded_food.csv"), terms=["corn syrup", "sugar"])
+    assert analysis.terms == ["corn syrup", "sugar"]
+    assert analysis.df["corn_syrup_idx"].tolist() == [7]
+    assert analysis.df["sugar_idx"].tolist() == [9]
+
+
+def test_session_food_is_independent(datadir):
+    analysis = session.AnalysisSession(datadir.join("branded_food.csv"), columns=None)
+    bfood = analysis.food()
+    assert isinstance(bfood, parser.FoodBrandObject)
+    bfood.clamp(ceiling=1)
+    bfood.df["extra"] = 1
+    assert bfood.df.empty
+    assert len(analysis.df) == 1
+    assert "extra" not in analysis.df
+    assert len(analysis.food().df) == 1